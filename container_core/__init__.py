@@ -0,0 +1,26 @@
+"""Ядро размещения груза без интерфейса: модель, хранилище и индексы.
+
+Пакет не импортирует tkinter и PIL, его можно использовать в скриптах
+и тестах без окна.
+"""
+from .model import Container, CargoType, Placement, LoadPlan
+from .packing import (ExtremePointPacker, SORT_KEYS, SCORES, auto_load, load_all,
+                      load_sequence, orientations, replan)
+from .search import STRATEGIES, StrategyResult, submit_all, submit_strategy, apply_result
+from .optimize import start_anneal
+from .manifest import IMPORT_CHUNK, open_rows, cargo_chunks
+from .project import PROJECT_EXT, ProjectFile, save_project, read_project, load_plans
+from .store import InstanceStore
+from .spatial import SpatialGrid, HeightMap, GRID_CELL_MM, HMAP_CELL_MM
+
+__all__ = [
+    "Container", "CargoType", "Placement", "LoadPlan", "ExtremePointPacker",
+    "SORT_KEYS", "SCORES", "auto_load", "load_all", "load_sequence", "replan",
+    "orientations",
+    "STRATEGIES", "StrategyResult", "submit_all", "submit_strategy", "apply_result",
+    "start_anneal",
+    "IMPORT_CHUNK", "open_rows", "cargo_chunks",
+    "PROJECT_EXT", "ProjectFile", "save_project", "read_project", "load_plans",
+    "InstanceStore", "SpatialGrid", "HeightMap",
+    "GRID_CELL_MM", "HMAP_CELL_MM",
+]
@@ -0,0 +1,133 @@
+"""Потоковое чтение и запись таблицы грузов и размещения в xlsx.
+
+Книга читается в read-only режиме openpyxl, а пишется в write-only:
+строки идут через файл по мере надобности и не держатся в памяти
+целиком. Разбор идёт пачками, чтобы окно успевало обновляться между ними.
+"""
+from .model import CargoType
+
+IMPORT_CHUNK = 1000                          # строк в одной пачке разбора
+EXPORT_CHUNK = 10_000                        # коробок за одну выборку из хранилища
+CARGO_SHEET = "Грузы"
+PLACEMENT_SHEET = "Размещение"
+CARGO_HEADER = ["№", "Название", "Количество", "Длина (мм)", "Ширина (мм)", "Высота (мм)",
+                "Вес (кг)", "Этой стороной вверх"]
+PLACEMENT_HEADER = ["Контейнер", "№ груза", "X (мм)", "Y (мм)", "Z (мм)",
+                    "Длина (мм)", "Ширина (мм)", "Высота (мм)", "Закреплена"]
+
+
+def open_rows(path, sheet=None):
+    """Открывает книгу для потокового чтения листа sheet (по умолчанию — активного).
+
+    Возвращает (генератор строк без заголовка, оценка числа строк, книга);
+    книгу нужно закрыть (wb.close()), когда строки больше не нужны.
+    Оценка берётся из размеров листа и может быть 0, если их нет в файле.
+    """
+    import openpyxl
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    ws = wb[sheet] if sheet in wb.sheetnames else wb.active
+    total = max(0, (ws.max_row or 0) - 1)
+    return ws.iter_rows(min_row=2, values_only=True), total, wb
+
+
+def sheet_rows(wb, sheet):
+    """(генератор строк листа без заголовка, оценка числа строк) или None, если листа нет."""
+    if sheet not in wb.sheetnames:
+        return None
+    ws = wb[sheet]
+    return ws.iter_rows(min_row=2, values_only=True), max(0, (ws.max_row or 0) - 1)
+
+
+def parse_row(row, cid):
+    """CargoType из строки (№, название, кол-во, Д, Ш, В, вес[, верх]).
+
+    ValueError — если строка неполная или числа неверные.
+    """
+    if not row or len(row) < 7 or not all(v not in (None, "") for v in row[:7]):
+        raise ValueError("Неполная строка")
+    _, name, qty, l, w, h, wt = row[:7]
+    name = str(name).strip()
+    qty, l, w, h, wt = int(qty), int(l), int(w), int(h), int(wt)
+    if not name or min(qty, l, w, h, wt) <= 0:
+        raise ValueError("Неверные значения")
+    upright = len(row) > 7 and bool(row[7])
+    return CargoType(cid, name, qty, l, w, h, wt, upright=upright)
+
+
+def cargo_chunks(rows, first_id, size=IMPORT_CHUNK, id_map=None):
+    """Разбирает rows пачками по size строк.
+
+    Генератор (грузы пачки, прочитано строк всего, пропущено всего);
+    id грузов идут подряд с first_id, неверные строки пропускаются.
+    В id_map, если он передан, пишется № из файла -> новый id.
+    """
+    cid = first_id
+    read = skipped = 0
+    chunk = []
+    for row in rows:
+        read += 1
+        try:
+            chunk.append(parse_row(row, cid))
+            if id_map is not None:
+                id_map[row[0]] = cid
+            cid += 1
+        except (TypeError, ValueError):
+            skipped += 1
+        if read % size == 0:
+            yield chunk, read, skipped
+            chunk = []
+    yield chunk, read, skipped
+
+
+def placement_chunks(rows, id_map, size=IMPORT_CHUNK):
+    """Разбирает лист размещения пачками по size строк.
+
+    Генератор (пачка, прочитано строк всего, пропущено всего), где пачка —
+    список (номер контейнера с 0, id груза, x, y, z, l, w, h, закреплена).
+    № груза переводится через id_map; строки неизвестных грузов пропускаются.
+    """
+    read = skipped = 0
+    chunk = []
+    for row in rows:
+        read += 1
+        try:
+            if not row or len(row) < 8 or row[1] not in id_map:
+                raise ValueError("Неизвестный груз")
+            plan = int(row[0]) - 1
+            x, y, z, l, w, h = (float(v) for v in row[2:8])
+            if plan < 0 or min(l, w, h) <= 0:
+                raise ValueError("Неверные значения")
+            chunk.append((plan, id_map[row[1]], x, y, z, l, w, h, len(row) > 8 and bool(row[8])))
+        except (TypeError, ValueError):
+            skipped += 1
+        if read % size == 0:
+            yield chunk, read, skipped
+            chunk = []
+    yield chunk, read, skipped
+
+
+def write_workbook(path, cargos, plans=()):
+    """Пишет лист грузов и лист размещения (по коробке на строку) в write-only режиме.
+
+    Коробки берутся из хранилища выборками по EXPORT_CHUNK, так что память
+    не растёт с размером плана.
+    """
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(CARGO_SHEET)
+    ws.append(CARGO_HEADER)
+    for c in cargos:
+        ws.append([c.id, c.name, c.qty, c.length, c.width, c.height, c.weight,
+                   1 if c.upright else 0])
+    ws = wb.create_sheet(PLACEMENT_SHEET)
+    ws.append(PLACEMENT_HEADER)
+    for i, plan in enumerate(plans, 1):
+        s = plan.store
+        hs = s.handles()
+        for k in range(0, hs.size, EXPORT_CHUNK):
+            part = hs[k:k + EXPORT_CHUNK]
+            for row in zip(s.cargo_id[part].tolist(), s.x[part].tolist(), s.y[part].tolist(),
+                           s.z[part].tolist(), s.length[part].tolist(), s.width[part].tolist(),
+                           s.height[part].tolist(), s.locked[part].tolist()):
+                ws.append([i, *row[:7], int(row[7])])
+    wb.save(path)
@@ -0,0 +1,320 @@
+"""Модель загрузки: контейнер, типы грузов, размещения и план."""
+from dataclasses import dataclass
+
+import numpy as np
+
+from .packing import ExtremePointPacker, auto_load
+from .store import InstanceStore
+from .spatial import SpatialGrid, HeightMap
+
+# повороты коробки: какая сторона груза (0 — длина, 1 — ширина, 2 — высота)
+# лежит вдоль x, y, z; порядок тот же, что у packing.orientations. Соседние
+# пары (0-1, 2-3, 4-5) отличаются перестановкой x и y — поворотом вокруг вертикали.
+ORIENTS = np.array([(0, 1, 2), (1, 0, 2), (0, 2, 1), (2, 0, 1), (1, 2, 0), (2, 1, 0)])
+
+
+def orient_of(dims, l, w, h):
+    """Номер поворота в ORIENTS, при котором груз dims даёт габариты (l, w, h).
+
+    dims — (длина, ширина, высота) или массив таких троек, габариты — числа
+    или массивы. Если габариты не подходят ни к одному повороту — 0.
+    """
+    shapes = np.take(np.asarray(dims, dtype=np.float64), ORIENTS, axis=-1)
+    box = np.stack(np.broadcast_arrays(l, w, h), axis=-1).astype(np.float64)
+    match = (box[..., None, :] == shapes).all(axis=-1)
+    return np.where(match.any(axis=-1), match.argmax(axis=-1), 0)
+
+
+@dataclass
+class Container:
+    length: float = 32_200                   # мм
+    width: float = 5_000
+    height: float = 5_000
+    max_weight: float = 28_000               # кг
+
+    @property
+    def volume(self):
+        """Объём, мм³."""
+        return self.length * self.width * self.height
+
+
+@dataclass
+class CargoType:
+    """Строка таблицы грузов: габариты одной коробки и нужное количество."""
+    id: int
+    name: str
+    qty: int
+    length: int
+    width: int
+    height: int
+    weight: float
+    placed: int = 0
+    upright: bool = False                    # "этой стороной вверх": только поворот вокруг вертикали
+
+    @property
+    def left(self):
+        return self.qty - self.placed
+
+    @property
+    def dims(self):
+        return self.length, self.width, self.height
+
+
+@dataclass
+class Placement:
+    cargo_id: int
+    x: float
+    y: float
+    z: float
+    length: float
+    width: float
+    height: float
+    locked: bool = False
+
+
+class LoadPlan:
+    """Грузы и размещённые коробки одного контейнера.
+
+    Коробки лежат в InstanceStore и адресуются handle; SpatialGrid и
+    HeightMap обновляются здесь же. План ничего не знает об отрисовке.
+    Несколько контейнеров одной отправки делят общий словарь cargos,
+    поэтому CargoType.placed — сумма по всем контейнерам.
+    """
+    def __init__(self, container=None, cargos=None):
+        self.container = container or Container()
+        c = self.container
+        # id -> CargoType, порядок = порядок строк таблицы
+        self.cargos = {} if cargos is None else cargos
+        self.store = InstanceStore()
+        self.grid = SpatialGrid(self.store, c.length, c.width)
+        self.hmap = HeightMap(self.grid, c.length, c.width)
+
+    def spawn(self):
+        """Пустой план ещё одного такого же контейнера с теми же грузами.
+
+        Дополнительные столбцы хранилища (add_column) переносятся.
+        """
+        plan = LoadPlan(self.container, self.cargos)
+        for col in self.store.extra:
+            plan.store.add_column(col, getattr(self.store, col).dtype)
+        return plan
+
+    # ---------------------------- грузы --------------------------------
+    def add_cargo(self, cargo):
+        self.cargos[cargo.id] = cargo
+        return cargo
+
+    def remove_cargo(self, cid):
+        """Удаляет груз со всеми его коробками."""
+        for hnd in self.store.handles(cid).tolist():
+            self.remove(hnd)
+        return self.cargos.pop(cid, None)
+
+    def update_cargo(self, cid, field, value):
+        """Меняет поле груза и переносит изменение на его коробки.
+
+        Возвращает handle коробок, у которых поменялись габариты. Поворот
+        каждой коробки сохраняется: правится та её сторона, что соответствует
+        изменённой стороне груза; коробка сдвигается внутрь контейнера.
+        ValueError — если габарит не больше нуля.
+        """
+        if field in ('length', 'width', 'height') and value <= 0:
+            raise ValueError("Габариты должны быть больше нуля")
+        cargo = self.cargos[cid]
+        setattr(cargo, field, value)
+        s = self.store
+        hs = s.handles(cid)
+        if field in ('length', 'width', 'height'):
+            dims = np.array(cargo.dims, dtype=np.float64)[ORIENTS[s.orient[hs]]]
+            for hnd, (l, w, h) in zip(hs.tolist(), dims.tolist()):
+                x, y, z = self.clamp(*s.box(hnd)[:3], l, w, h)
+                self.move(hnd, x, y, z, dims=(l, w, h))
+            return hs
+        if field == 'weight':
+            s.set_weight(hs, value)
+        elif field == 'name':
+            s.name_id[hs] = s.intern(value)
+        return hs[:0]
+
+    # --------------------------- коробки -------------------------------
+    def place(self, cargo_id, x, y, z, l, w, h, weight=None, name=None, locked=False):
+        """Ставит коробку; locked — поставлена вручную (см. release)."""
+        cargo = self.cargos[cargo_id]
+        hnd = self.store.add(cargo_id, x, y, z, l, w, h,
+                             cargo.weight if weight is None else weight,
+                             cargo.name if name is None else name, locked,
+                             int(orient_of(cargo.dims, l, w, h)))
+        cargo.placed += 1
+        self.grid.insert(hnd)
+        self.hmap.add(hnd)
+        return hnd
+
+    def place_many(self, cargo_id, x, y, z, l, w, h, weight, name_id, locked):
+        """Ставит сразу много коробок (массивы); карта высот пересчитывается один раз.
+
+        name_id — номера имён в self.store (InstanceStore.intern).
+        Возвращает массив handle.
+        """
+        cargo_id = np.asarray(cargo_id)
+        lut = np.zeros((max(self.cargos, default=0) + 1, 3))
+        for c in self.cargos.values():
+            lut[c.id] = c.dims
+        known = cargo_id < lut.shape[0]
+        orient = orient_of(lut[np.where(known, cargo_id, 0)], l, w, h) * known
+        hs = self.store.add_many(cargo_id, x, y, z, l, w, h, weight, name_id, locked, orient)
+        if hs.size:
+            counts = np.bincount(self.store.cargo_id[hs])
+            for cargo in self.cargos.values():
+                if cargo.id < counts.size:
+                    cargo.placed += int(counts[cargo.id])
+        self.grid.insert_many(hs)
+        self.hmap.rebuild()
+        return hs
+
+    def remove(self, hnd):
+        s = self.store
+        if not s.alive[hnd]:
+            return
+        cargo = self.cargos.get(int(s.cargo_id[hnd]))
+        self.hmap.remove(hnd)
+        self.hmap.detached.discard(hnd)      # handle пойдёт в повторное использование
+        self.grid.remove(hnd)
+        s.remove(hnd)
+        if cargo is not None:
+            cargo.placed = max(0, cargo.placed - 1)
+
+    def move(self, hnd, x, y, z, dims=None):
+        s = self.store
+        l, w, h = dims if dims else (s.length[hnd], s.width[hnd], s.height[hnd])
+        self.hmap.remove(hnd)
+        self.grid.remove(hnd)
+        s.set_box(hnd, x, y, z, l, w, h)
+        self.grid.insert(hnd)
+        self.hmap.add(hnd)
+
+    def lock(self, hnds, locked=True):
+        """Закрепляет (или открепляет) коробки."""
+        self.store.locked[np.asarray(hnds, dtype=np.int64)] = locked
+
+    def remove_many(self, hnds):
+        """Удаляет сразу много коробок; карта высот пересчитывается один раз."""
+        s = self.store
+        hnds = np.asarray(hnds, dtype=np.int64)
+        hnds = hnds[s.alive[hnds]]
+        self._unplace(hnds)
+        for hnd in hnds.tolist():
+            self.grid.remove(hnd)
+            s.remove(hnd)
+        self.hmap.detached.difference_update(hnds.tolist())
+        self.hmap.rebuild()
+
+    def release(self):
+        """Снимает все незакреплённые коробки; возвращает их handle."""
+        s = self.store
+        hs = s.handles()
+        hs = hs[~s.locked[hs]]
+        self.remove_many(hs)
+        return hs
+
+    def _unplace(self, hnds):
+        """Вычитает коробки hnds из CargoType.placed."""
+        if not hnds.size:
+            return
+        counts = np.bincount(self.store.cargo_id[hnds])
+        for cargo in self.cargos.values():
+            if cargo.id < counts.size:
+                cargo.placed = max(0, cargo.placed - int(counts[cargo.id]))
+
+    def clear(self):
+        s = self.store
+        self._unplace(s.handles())
+        s.clear()
+        self.grid.clear()
+        self.hmap.clear()
+
+    def placements(self):
+        s = self.store
+        for hnd in s.handles().tolist():
+            yield Placement(int(s.cargo_id[hnd]), *s.box(hnd), bool(s.locked[hnd]))
+
+    # -------------------------- геометрия ------------------------------
+    def clamp(self, x, y, z, l, w, h):
+        """Сдвигает коробку внутрь контейнера."""
+        c = self.container
+        return (max(0, min(c.length - l, x)),
+                max(0, min(c.width - w, y)),
+                max(0, min(c.height - h, z)))
+
+    def fits(self, x, y, z, l, w, h):
+        c = self.container
+        return (x >= 0 and y >= 0 and z >= 0 and x + l <= c.length
+                and y + w <= c.width and z + h <= c.height)
+
+    def drop_z(self, x, y, l, w, exclude=()):
+        """Высота, на которую ляжет площадка; exclude и detached не в счёт."""
+        exclude = set(exclude)
+        if exclude <= self.hmap.detached:
+            return self.hmap.top_z(x, y, l, w)
+        return self.grid.top_z(x, y, l, w, exclude=exclude | self.hmap.detached)
+
+    def drop_z_many(self, x, y, ls, ws):
+        """drop_z сразу для нескольких площадок с общим углом (x, y)."""
+        return self.grid.top_z_many(x, y, ls, ws, exclude=self.hmap.detached)
+
+    def collides(self, x, y, z, l, w, h, exclude=()):
+        """True, если коробка пересекается с уже размещёнными."""
+        return self.grid.collides(x, y, z, l, w, h, exclude=exclude)
+
+    def window(self, ax, a0, a1, bx, b0, b1):
+        """handle коробок, задевающих окно [a0, a1] × [b0, b1] мм на осях ax, bx.
+
+        Кандидаты берутся из сетки по полу (вдоль z сетка окно не сужает),
+        затем проверяются точно.
+        """
+        c = self.container
+        lo = {'x': 0.0, 'y': 0.0, 'z': 0.0}
+        hi = {'x': c.length, 'y': c.width, 'z': c.height}
+        lo[ax], hi[ax] = a0, a1
+        lo[bx], hi[bx] = b0, b1
+        keys = self.grid.query(lo['x'], lo['y'], hi['x'] - lo['x'], hi['y'] - lo['y'])
+        cand = np.fromiter(keys, dtype=np.int64, count=len(keys))
+        s = self.store
+        mask = np.ones(cand.size, dtype=bool)
+        for axis, size in (('x', s.length), ('y', s.width), ('z', s.height)):
+            pos = getattr(s, axis)[cand]
+            mask &= (pos < hi[axis]) & (pos + size[cand] > lo[axis])
+        return cand[mask]
+
+    def detach(self, keys):
+        self.hmap.detach(keys)
+
+    def attach(self, keys):
+        self.hmap.attach(keys)
+
+    def rotate(self, hnd):
+        """Поворачивает коробку на 90° вокруг вертикали, ValueError — если некуда."""
+        x, y, z, l, w, h = self.store.box(hnd)
+        new_l, new_w = w, l
+        if not self.fits(x, y, z, new_l, new_w, h):
+            raise ValueError("Поворот выходит за границы")
+        if self.collides(x, y, z, new_l, new_w, h, exclude=[hnd]):
+            raise ValueError("Поворот приведёт к пересечению")
+        new_z = self.drop_z(x, y, new_l, new_w, exclude=[hnd])
+        self.move(hnd, x, y, new_z, dims=(new_l, new_w, h))
+        self.store.orient[hnd] ^= 1          # парный поворот в ORIENTS
+
+    def place_batch(self, cargo_id):
+        """Укладывает остаток груза по крайним точкам вокруг уже стоящих коробок.
+
+        Возвращает handle новых коробок.
+        """
+        cargo = self.cargos[cargo_id]
+        return ExtremePointPacker(self).pack(cargo_id, max(0, cargo.left))
+
+    def auto_load(self, order='volume'):
+        """Укладывает остатки всех грузов; order — ключ packing.SORT_KEYS."""
+        return auto_load(self, order)
+
+    # --------------------------- итоги ---------------------------------
+    def fill_ratio(self):
+        return self.store.total_volume / self.container.volume
@@ -0,0 +1,189 @@
+"""Оптимизация укладки отжигом по последовательности блоков.
+
+Решение — порядок блоков (cargo_id, count, shapes) и правило выбора точки;
+план из него строит load_sequence (декодер). Соседнее решение получается
+перестановкой, переносом, разбиением или слиянием блоков, сменой поворота
+блока или правила выбора точки. Закреплённые коробки остаются на местах,
+незакреплённые перекладываются заново; стартовое решение повторяет их
+текущую укладку. Отжиг идёт в отдельном процессе, улучшения (только лучше
+текущего плана) и скорость декодирования (планов в секунду) приходят через
+очередь.
+"""
+import math
+import multiprocessing
+import random
+import time
+
+import numpy as np
+
+from .packing import SORT_KEYS, SCORES, load_sequence, orientations
+from .search import snapshot, restore, make_result
+
+T0 = 0.02                                    # начальная температура, доли контейнера
+RATE_EVERY_S = 0.5                           # как часто сообщать скорость
+MAX_BLOCKS_PER_CARGO = 4                     # предел дробления груза на блоки
+
+
+def cost(result, left_volume, volume):
+    """Меньше — лучше: всё уложено, меньше контейнеров, пустее последний.
+
+    Объём общий, поэтому пустой последний контейнер — это плотные первые.
+    """
+    return 10 * left_volume / volume + (result.containers - 1) + result.fills[-1]
+
+
+def left_volume(cargos):
+    """Объём коробок, которые никуда не поместились."""
+    return sum(max(0, c.left) * c.length * c.width * c.height for c in cargos)
+
+
+def decode(container, cargos, boxes, genome, deadline=None):
+    """Строит план по решению genome = (score, blocks); возвращает (result, cost)."""
+    t0 = time.perf_counter()
+    score, blocks = genome
+    plans = restore(container, cargos, boxes)
+    added = load_sequence(plans, blocks, score, deadline)
+    timed_out = deadline is not None and time.time() > deadline
+    result = make_result(plans, added, 'anneal', score, time.perf_counter() - t0, timed_out)
+    return result, cost(result, left_volume(plans[0].cargos.values()), container.volume)
+
+
+def seed_blocks(plans):
+    """Блоки текущей укладки незакреплённых коробок.
+
+    Коробки идут по планам и внутри плана по handle (для плана после
+    укладки — порядок загрузки); подряд идущие коробки одного груза — один
+    блок, с их поворотом, если он у всех один. Блоков одного груза не больше
+    MAX_BLOCKS_PER_CARGO: лишние сливаются с последним.
+    """
+    blocks = []
+    last = {}                                # cargo_id -> номер его последнего блока
+    for plan in plans:
+        s = plan.store
+        hs = s.handles()
+        hs = hs[~s.locked[hs]]
+        dims = np.column_stack((s.length[hs], s.width[hs], s.height[hs]))
+        cid = s.cargo_id[hs]
+        for i, (c, d) in enumerate(zip(cid.tolist(), map(tuple, dims.tolist()))):
+            if i and c == cid[i - 1] or c in last and \
+                    sum(1 for b in blocks if b[0] == c) >= MAX_BLOCKS_PER_CARGO:
+                b = blocks[last[c]]
+                b[1] += 1
+                if b[2] is not None and b[2] != (d,):
+                    b[2] = None
+            else:
+                last[c] = len(blocks)
+                blocks.append([c, 1, (d,)])
+    return [tuple(b) for b in blocks]
+
+
+def initial(container, cargos, boxes, seed=()):
+    """Стартовое решение: блоки seed, затем остатки как в load_all(order='volume').
+
+    seed — seed_blocks текущих планов.
+    """
+    left = {c.id: c.left for c in restore(container, cargos, boxes)[0].cargos.values()}
+    blocks = []
+    for cid, count, shapes in seed:
+        count = min(count, left.get(cid, 0))
+        if count > 0:
+            left[cid] -= count
+            blocks.append((cid, count, shapes))
+    order = sorted((c for c in cargos if left[c.id] > 0), key=SORT_KEYS['volume'], reverse=True)
+    return SCORES[0], blocks + [(c.id, left[c.id], None) for c in order]
+
+
+def mutate(genome, shapes_of, rng):
+    """Случайное соседнее решение; genome не меняется."""
+    score, blocks = genome
+    blocks = [list(b) for b in blocks]
+    n = len(blocks)
+    op = rng.randrange(6)
+    if op == 0 and n > 1:                    # перестановка двух блоков
+        i, j = rng.sample(range(n), 2)
+        blocks[i], blocks[j] = blocks[j], blocks[i]
+    elif op == 1 and n > 1:                  # перенос блока
+        b = blocks.pop(rng.randrange(n))
+        blocks.insert(rng.randrange(n), b)
+    elif op == 2:                            # поворот блока: один из допустимых или любой
+        b = rng.choice(blocks)
+        shapes = shapes_of[b[0]]
+        if b[2] is not None and rng.random() < 0.5 or len(shapes) == 1:
+            b[2] = None
+        else:
+            b[2] = (rng.choice(shapes),)
+    elif op == 3:                            # разбиение блока, часть — в другое место
+        i = rng.randrange(n)
+        b = blocks[i]
+        same = sum(1 for c in blocks if c[0] == b[0])
+        if b[1] > 1 and same < MAX_BLOCKS_PER_CARGO:
+            k = rng.randint(1, b[1] - 1)
+            b[1] -= k
+            blocks.insert(rng.randrange(n + 1), [b[0], k, b[2]])
+    elif op == 4:                            # слияние блока со следующим блоком того же груза
+        i = rng.randrange(n)
+        for j in range(i + 1, n):
+            if blocks[j][0] == blocks[i][0]:
+                blocks[i][1] += blocks.pop(j)[1]
+                break
+    else:
+        score = rng.choice([s for s in SCORES if s != score] or SCORES)
+    return score, [tuple(b) for b in blocks]
+
+
+def anneal(container, cargos, boxes, budget, queue, stop, seed=None, start=(),
+           best_cost=math.inf):
+    """Отжиг в течение budget секунд или до stop.is_set().
+
+    start — блоки стартового решения (seed_blocks), best_cost — стоимость
+    текущего плана: сообщаются только решения дешевле неё.
+    В queue кладутся ('best', StrategyResult, cost) при каждом улучшении,
+    ('rate', планов, секунд) раз в RATE_EVERY_S и в конце ('done', планов,
+    секунд). Температура линейно падает от T0 до нуля к концу бюджета.
+    """
+    rng = random.Random(seed)
+    t0 = time.time()
+    deadline = t0 + budget
+    shapes_of = {c.id: orientations(*c.dims, upright=c.upright) for c in cargos}
+    genome = initial(container, cargos, boxes, start)
+    n = 0
+    last_rate = t0
+    cur_cost = math.inf
+    while not stop.is_set() and time.time() < deadline:
+        cand = mutate(genome, shapes_of, rng) if n else genome
+        if not cand[1]:
+            break
+        result, c = decode(container, cargos, boxes, cand, deadline)
+        n += 1
+        now = time.time()
+        if result.timed_out:
+            break
+        temp = T0 * max(0.0, deadline - now) / budget
+        if c <= cur_cost or temp > 0 and rng.random() < math.exp((cur_cost - c) / temp):
+            genome, cur_cost = cand, c
+        if c < best_cost:
+            best_cost = c
+            queue.put(('best', result, c))
+        if now - last_rate >= RATE_EVERY_S:
+            queue.put(('rate', n, now - t0))
+            last_rate = now
+    queue.put(('done', n, time.time() - t0))
+
+
+def start_anneal(plans, budget, seed=None):
+    """Запускает anneal в отдельном процессе по текущим планам.
+
+    Закреплённые коробки остаются, остальные отжиг перекладывает, начиная с
+    их текущей укладки. Возвращает (процесс, очередь сообщений, событие
+    остановки).
+    """
+    container, cargos, boxes = snapshot(plans, locked_only=True)
+    current = make_result(plans, {}, 'anneal', SCORES[0], 0.0)
+    best_cost = cost(current, left_volume(plans[0].cargos.values()), container.volume)
+    queue = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    proc = multiprocessing.Process(target=anneal, daemon=True,
+                                   args=(container, cargos, boxes, budget, queue, stop, seed,
+                                         seed_blocks(plans), best_cost))
+    proc.start()
+    return proc, queue, stop
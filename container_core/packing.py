@@ -0,0 +1,315 @@
+"""Укладка партий методом крайних точек (extreme points)."""
+import time
+
+import numpy as np
+
+# порядок грузов при автозагрузке: ключ -> величина, по убыванию которой идём
+SORT_KEYS = {
+    'volume': lambda c: c.length * c.width * c.height,
+    'footprint': lambda c: c.length * c.width,
+    'weight': lambda c: c.weight,
+}
+
+# выбор точки: 'floor' — сначала самый низкий верх коробки (слоями по полу),
+# 'wall' — сначала самая дальняя от дверей x (стенками поперёк контейнера)
+SCORES = ('floor', 'wall')
+
+
+def orientations(l, w, h, upright=False):
+    """Различные повороты коробки вдоль осей: до шести, upright — только два.
+
+    upright ("этой стороной вверх") разрешает лишь поворот вокруг вертикали.
+    """
+    shapes = ((l, w, h), (w, l, h))
+    if not upright:
+        shapes += ((l, h, w), (h, l, w), (w, h, l), (h, w, l))
+    return tuple(dict.fromkeys(shapes))
+
+
+class ExtremePointPacker:
+    """Укладывает коробки в LoadPlan по крайним точкам.
+
+    Кандидаты — точки (x, y) на полу: углы уже размещённых коробок справа
+    (x + l, y) и сзади (x, y + w). Коробка в точке опускается по карте высот
+    на верх столбца под площадкой, поэтому проверка допустимости — это
+    границы контейнера и высота столбца. Из всех пар (поворот, точка)
+    берётся та, где верх коробки ниже всего, затем ближняя к x = 0, затем
+    к y = 0 (score='floor'), или сначала ближняя к x = 0, затем с самым
+    низким верхом (score='wall'). Одинаковые коробки ставятся в выбранную точку сразу колонной
+    до потолка — поиск точки идёт один раз на колонну.
+
+    Высоты столбцов и ключи выбора хранятся матрицей «точка × поворот».
+    Для новой точки или нового набора поворотов высота столбца сначала
+    оценивается снизу высотой в самой точке (probe), а точные высоты
+    точки (сразу во всех поворотах) считаются, только когда её пара
+    выходит в лидеры. После
+    каждой установки у пар, чья площадка задевает новую коробку, высота
+    просто поднимается до её верха — и точная, и оценка снизу остаются
+    верными. Выбор, поиск задетых пар и их обновление — несколько операций
+    NumPy на всю матрицу. Точки на одинаковых (x, y) разных слоёв совпадают,
+    так что их число растёт с площадью пола, а не с числом коробок.
+    """
+    PROBE = 1                                # сторона площадки для высоты в точке, мм
+
+    def __init__(self, plan, score='floor'):
+        self.plan = plan
+        c = plan.container
+        self.L, self.W, self.H = c.length, c.width, c.height
+        self.score = score
+        self.seen = set()
+        self.px = np.zeros(256, dtype=np.float64)
+        self.py = np.zeros(256, dtype=np.float64)
+        self.lb = np.zeros(256, dtype=np.float64)       # высота в самой точке
+        self.tops = np.zeros((256, 0), dtype=np.float64)
+        self.key = np.zeros((256, 0), dtype=np.float64)
+        self.exact = np.zeros((256, 0), dtype=bool)     # tops точна, а не оценка снизу
+        self.size = 0
+        self.valid = 0                       # у точек [0, valid) есть столбцы для shapes
+        self.shapes = ()
+        self.add_point(0, 0)
+        # углы стоящих коробок; у штабелей они совпадают, поэтому сначала unique
+        s = plan.store
+        hs = s.handles()
+        x, y = s.x[hs], s.y[hs]
+        pts = np.unique(np.column_stack((np.concatenate((x, x + s.length[hs], x)),
+                                         np.concatenate((y, y, y + s.width[hs])))), axis=0)
+        for x, y in pts.tolist():
+            self.add_point(x, y)
+
+    def add_point(self, x, y):
+        if x >= self.L or y >= self.W or (x, y) in self.seen:
+            return
+        self.seen.add((x, y))
+        cap = self.px.size
+        if self.size == cap:
+            for col in ('px', 'py', 'lb', 'tops', 'key', 'exact'):
+                old = getattr(self, col)
+                arr = np.zeros((cap * 2,) + old.shape[1:], dtype=old.dtype)
+                arr[:cap] = old
+                setattr(self, col, arr)
+        self.px[self.size] = x
+        self.py[self.size] = y
+        self.lb[self.size] = self.plan.drop_z(x, y, self.PROBE, self.PROBE)
+        self.size += 1
+
+    def _set_shapes(self, shapes):
+        self.shapes = shapes
+        cap = self.px.size
+        self.tops = np.zeros((cap, len(shapes)), dtype=np.float64)
+        self.key = np.zeros((cap, len(shapes)), dtype=np.float64)
+        self.exact = np.zeros((cap, len(shapes)), dtype=bool)
+        self.sl, self.sw, self.sh = np.array(shapes, dtype=np.float64).T
+        self.max_l, self.max_w = self.sl.max(), self.sw.max()
+        self.valid = 0
+
+    def _open_columns(self, start, stop):
+        """Столбцы точек [start, stop): оценка снизу, вне пола — сразу inf."""
+        rows = np.s_[start:stop]
+        out = ((self.px[rows, None] + self.sl > self.L) |
+               (self.py[rows, None] + self.sw > self.W))
+        self.tops[rows] = np.where(out, np.inf, self.lb[rows, None])
+        self.exact[rows] = out
+        self._keys(rows)
+
+    def _refine(self, i):
+        """Точные высоты столбцов точки i сразу во всех неуточнённых поворотах."""
+        os = np.flatnonzero(~self.exact[i])
+        self.tops[i, os] = self.plan.drop_z_many(self.px[i], self.py[i],
+                                                 self.sl[os], self.sw[os])
+        self.exact[i, os] = True
+        self._keys(np.s_[i:i + 1])
+
+    def _keys(self, rows):
+        """Ключ выбора по (верх коробки, x, y) или (x, верх, y); у недопустимых пар — inf.
+
+        Ключ растёт вместе с высотой столбца, поэтому оценка снизу даёт
+        оценку снизу и для ключа.
+        """
+        top = self.tops[rows] + self.sh
+        px = self.px[rows, None]
+        if self.score == 'wall':
+            key = (px * (self.H + 1) + top) * self.W + self.py[rows, None]
+        else:
+            key = (top * self.L + px) * self.W + self.py[rows, None]
+        self.key[rows] = np.where(top <= self.H, key, np.inf)
+
+    def place(self, cargo_id, shapes, count=1, weight=None, name=None):
+        """Ставит в лучшую точку и поворот колонну до count одинаковых коробок.
+
+        Точка выбирается по первой коробке, остальные ложатся на неё до
+        потолка. Возвращает handle поставленных (пустой список — места нет).
+        """
+        if self.shapes != shapes:
+            self._set_shapes(shapes)
+        if self.valid < self.size:
+            self._open_columns(self.valid, self.size)
+            self.valid = self.size
+        n = self.size
+        key = self.key[:n]
+        while True:
+            # ключ по оценке снизу не больше точного: лидер с точным ключом — лучший
+            best, o = divmod(int(np.argmin(key)), len(shapes))
+            if key[best, o] == np.inf:
+                return []
+            if self.exact[best, o]:
+                break
+            self._refine(best)
+        l, w, h = shapes[o]
+        x, y, z = float(self.px[best]), float(self.py[best]), float(self.tops[best, o])
+        k = max(1, min(count, int((self.H - z) // h)))
+        added = [self.plan.place(cargo_id, x, y, z + j * h, l, w, h, weight=weight, name=name)
+                 for j in range(k)]
+        top = z + k * h
+
+        # точки, которые задевает хоть один поворот, затем пары на них
+        px, py = self.px[:n], self.py[:n]
+        cols = np.flatnonzero((px < x + l) & (px + self.max_l > x) &
+                              (py < y + w) & (py + self.max_w > y))
+        if cols.size:
+            px, py = px[cols], py[cols]
+            hit = (px[:, None] + self.sl > x) & (py[:, None] + self.sw > y)
+            # столбец над новой коробкой поднимается ровно до её верха
+            tops = self.tops[cols]
+            self.tops[cols] = np.where(hit, np.maximum(tops, top), tops)
+            self._keys(cols)
+            under = (px + self.PROBE > x) & (py + self.PROBE > y)
+            self.lb[cols[under]] = np.maximum(self.lb[cols[under]], top)
+        self.add_point(x + l, y)
+        self.add_point(x, y + w)
+        return added
+
+    def pack(self, cargo_id, count, shapes=None, deadline=None):
+        """Ставит до count коробок груза; возвращает handle поставленных.
+
+        shapes — допустимые габариты (l, w, h); по умолчанию все повороты груза.
+        deadline — момент time.time(), после которого укладка прекращается.
+        """
+        cargo = self.plan.cargos[cargo_id]
+        shapes = shapes or orientations(*cargo.dims, upright=cargo.upright)
+        added = []
+        while len(added) < count:
+            if deadline is not None and time.time() > deadline:
+                break
+            column = self.place(cargo_id, shapes, count - len(added))
+            if not column:
+                break
+            added += column
+        return added
+
+
+def auto_load(plan, order='volume', score='floor', deadline=None):
+    """Укладывает остатки всех грузов плана одной серией крайних точек.
+
+    Грузы идут по убыванию SORT_KEYS[order]; груз, который не влезает по
+    весу в max_weight контейнера, ставится в том количестве, что влезает.
+    Возвращает handle новых коробок.
+    """
+    key = SORT_KEYS[order]
+    cargos = sorted((c for c in plan.cargos.values() if c.left > 0), key=key, reverse=True)
+    packer = ExtremePointPacker(plan, score)
+    added = []
+    for cargo in cargos:
+        count = cargo.left
+        if cargo.weight > 0:
+            room = plan.container.max_weight - plan.store.total_weight
+            count = min(count, max(0, int(room // cargo.weight)))
+        added += packer.pack(cargo.id, count, deadline=deadline)
+    return added
+
+
+def load_all(plans, order='volume', score='floor', deadline=None):
+    """Раскладывает остатки грузов по контейнерам, добавляя новые по мере нужды.
+
+    Грузы идут по убыванию SORT_KEYS[order]; подробности — load_sequence.
+    Возвращает {номер плана: handle новых коробок}.
+    """
+    cargos = sorted((c for c in plans[0].cargos.values() if c.left > 0),
+                    key=SORT_KEYS[order], reverse=True)
+    return load_sequence(plans, [(c.id, c.left, None) for c in cargos], score, deadline)
+
+
+def misfits(plan):
+    """Незакреплённые коробки плана, которые не могут остаться на месте.
+
+    Это коробки вне контейнера, пересекающиеся с другими (из пары
+    пересекающихся — та, что с меньшим handle) и последние по handle
+    коробки сверх max_weight. Закреплённые не проверяются.
+    """
+    s = plan.store
+    hs = s.handles()
+    hs = hs[~s.locked[hs]]
+    out = set()
+    kept = []
+    for hnd in hs.tolist():
+        box = s.box(hnd)
+        if not plan.fits(*box) or plan.collides(*box, exclude=out | {hnd}):
+            out.add(hnd)
+        else:
+            kept.append(hnd)
+    extra = s.total_weight - plan.container.max_weight
+    while extra > 0 and kept:
+        hnd = kept.pop()
+        extra -= s.weight[hnd]
+        out.add(hnd)
+    return np.fromiter(out, dtype=np.int64, count=len(out))
+
+
+def replan(plans, order='volume', score='floor', deadline=None):
+    """Тёплый старт: дозагружает остатки вокруг уже стоящих коробок.
+
+    Закреплённые коробки остаются на месте, незакреплённые — тоже, если
+    могут (см. misfits); остальные снимаются и укладываются заново вместе с
+    остатками. Опустевшие контейнеры в конце списка (кроме первого)
+    убираются, и остатки раскладываются load_all вокруг стоящих коробок —
+    их объём сразу занят в карте высот, а углы становятся крайними точками.
+    Возвращает {номер плана: handle новых коробок}.
+    """
+    for plan in plans:
+        plan.remove_many(misfits(plan))
+    while len(plans) > 1 and len(plans[-1].store) == 0:
+        plans.pop()
+    return load_all(plans, order, score, deadline)
+
+
+def load_sequence(plans, blocks, score='floor', deadline=None):
+    """Укладывает блоки (cargo_id, count, shapes) по контейнерам по порядку.
+
+    Сначала дозаполняются планы из plans, затем в конец списка добавляются
+    новые контейнеры (plans[0].spawn()), пока всё не уложено или пока новый
+    пустой контейнер не принял ни одной коробки. Каждый контейнер заполняется
+    всеми блоками целиком, прежде чем открыть следующий, — так их меньше;
+    остаток блока переходит в следующий контейнер. shapes=None — все
+    повороты груза. Груз ставится не больше, чем позволяет max_weight.
+    После deadline (time.time()) укладка обрывается.
+    Возвращает {номер плана: handle новых коробок}.
+    """
+    blocks = [[cid, count, shapes] for cid, count, shapes in blocks if count > 0]
+    cargos = plans[0].cargos
+    given = len(plans)
+    added = {}
+    i = 0
+    while blocks:
+        if deadline is not None and time.time() > deadline:
+            break
+        if i == len(plans):
+            plans.append(plans[0].spawn())
+        plan = plans[i]
+        packer = ExtremePointPacker(plan, score)
+        hs = []
+        for block in blocks:
+            cargo = cargos[block[0]]
+            count = block[1]
+            if cargo.weight > 0:
+                room = plan.container.max_weight - plan.store.total_weight
+                count = min(count, max(0, int(room // cargo.weight)))
+            got = packer.pack(cargo.id, count, block[2], deadline)
+            block[1] -= len(got)
+            hs += got
+        blocks = [b for b in blocks if b[1] > 0]
+        if hs:
+            added[i] = hs
+        elif len(plan.store) == 0 and i >= given:   # остаток не влезает даже в пустой контейнер
+            plans.pop()
+            break
+        i += 1
+    return added
@@ -0,0 +1,191 @@
+"""Двоичный файл проекта: грузы и все коробки всех контейнеров.
+
+Раскладка (little-endian):
+    заголовок HEADER | грузы CARGO × n_cargos | коробки BOX × n_boxes |
+    смещения строк u8 × (n_strings + 1) | строки UTF-8 подряд.
+Записи фиксированной длины, имена — номера в таблице строк, коробки
+идут по контейнерам подряд. Чтение — один np.memmap и срезы .view(),
+без разбора по строкам в Python. Первые 8 байт (магия, версия) у всех
+версий одинаковы; раскладка каждой версии хранится в LAYOUTS, поэтому
+старые файлы читаются и после смены формата.
+"""
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+from .model import Container, CargoType
+
+MAGIC = b"CPLN"
+VERSION = 1
+PROJECT_EXT = ".cplan"
+
+PREFIX = np.dtype([('magic', 'S4'), ('version', '<u2'), ('flags', '<u2')])
+
+HEADER_V1 = np.dtype(PREFIX.descr + [
+    ('length', '<f8'), ('width', '<f8'), ('height', '<f8'), ('max_weight', '<f8'),
+    ('n_cargos', '<u4'), ('n_boxes', '<u4'), ('n_plans', '<u4'), ('n_strings', '<u4'),
+])
+CARGO_V1 = np.dtype([
+    ('id', '<i4'), ('name', '<u4'), ('qty', '<i4'),
+    ('length', '<i4'), ('width', '<i4'), ('height', '<i4'),
+    ('weight', '<f8'), ('upright', 'u1'), ('pad', 'V7'),
+])
+BOX_V1 = np.dtype([
+    ('plan', '<u4'), ('cargo_id', '<i4'),
+    ('x', '<f8'), ('y', '<f8'), ('z', '<f8'),
+    ('length', '<f8'), ('width', '<f8'), ('height', '<f8'),
+    ('weight', '<f8'), ('name', '<u4'), ('locked', 'u1'), ('pad', 'V3'),
+])
+
+# версия -> (заголовок, запись груза, запись коробки)
+LAYOUTS = {1: (HEADER_V1, CARGO_V1, BOX_V1)}
+
+SIZE_OF = {'x': 'length', 'y': 'width', 'z': 'height'}   # ось -> габарит вдоль неё
+
+
+@dataclass
+class ProjectFile:
+    """Прочитанный файл проекта; boxes — срез memmap, данные читаются по требованию."""
+    version: int
+    container: Container
+    cargos: list                             # CargoType
+    boxes: np.ndarray = None                 # записи BOX, по контейнерам подряд
+    names: list = None                       # таблица строк
+    n_plans: int = 1
+
+    def plan_slices(self):
+        """Границы коробок каждого контейнера в boxes: [(начало, конец), ...].
+
+        Двоичный поиск по отображённому файлу — читается лишь несколько страниц.
+        """
+        edges = np.searchsorted(self.boxes['plan'], np.arange(self.n_plans + 1))
+        return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+    def window(self, bounds, ax, a0, a1, bx, b0, b1):
+        """Записи коробок среза bounds, задевающих окно [a0, a1] × [b0, b1] мм.
+
+        Окно задано на осях ax, bx ('x', 'y' или 'z'); bounds — (начало, конец)
+        из plan_slices. Читаются только столбцы этого контейнера, результат —
+        копия, не связанная с файлом.
+        """
+        rec = self.boxes[bounds[0]:bounds[1]]
+        a, b = rec[ax], rec[bx]
+        mask = ((a < a1) & (a + rec[SIZE_OF[ax]] > a0) &
+                (b < b1) & (b + rec[SIZE_OF[bx]] > b0))
+        return np.array(rec[mask])
+
+
+def _number(v):
+    v = float(v)
+    return int(v) if v.is_integer() else v
+
+
+def save_project(path, plans):
+    """Пишет грузы и коробки всех планов в path (через временный файл)."""
+    strings = {}
+
+    def intern(name):
+        return strings.setdefault(name, len(strings))
+
+    cargo_list = list(plans[0].cargos.values())
+    cargos = np.zeros(len(cargo_list), dtype=CARGO_V1)
+    for rec, c in zip(cargos, cargo_list):
+        rec['id'], rec['name'], rec['qty'] = c.id, intern(c.name), c.qty
+        rec['length'], rec['width'], rec['height'] = c.length, c.width, c.height
+        rec['weight'], rec['upright'] = c.weight, c.upright
+
+    parts = []
+    for i, plan in enumerate(plans):
+        s = plan.store
+        hs = s.handles()
+        part = np.zeros(hs.size, dtype=BOX_V1)
+        part['plan'] = i
+        for col in ('cargo_id', 'x', 'y', 'z', 'length', 'width', 'height', 'weight', 'locked'):
+            part[col] = getattr(s, col)[hs]
+        lut = np.array([intern(name) for name in s.names] or [0], dtype=np.uint32)
+        part['name'] = lut[s.name_id[hs]]
+        parts.append(part)
+    boxes = np.concatenate(parts) if parts else np.zeros(0, dtype=BOX_V1)
+
+    blobs = [name.encode("utf-8") for name in strings]
+    offsets = np.zeros(len(blobs) + 1, dtype='<u8')
+    offsets[1:] = np.cumsum([len(b) for b in blobs])
+
+    c = plans[0].container
+    header = np.zeros(1, dtype=HEADER_V1)
+    header['magic'], header['version'] = MAGIC, VERSION
+    header['length'], header['width'], header['height'] = c.length, c.width, c.height
+    header['max_weight'] = c.max_weight
+    header['n_cargos'], header['n_boxes'] = cargos.size, boxes.size
+    header['n_plans'], header['n_strings'] = len(plans), len(blobs)
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        for arr in (header, cargos, boxes, offsets):
+            f.write(arr.tobytes())
+        f.write(b"".join(blobs))
+    os.replace(tmp, path)
+
+
+def read_project(path):
+    """Открывает файл проекта через memmap; ValueError — если это не он.
+
+    Коробки не копируются: ProjectFile.boxes ссылается на отображённый файл.
+    """
+    raw = np.memmap(path, dtype=np.uint8, mode='r')
+    if raw.size < PREFIX.itemsize:
+        raise ValueError("Файл проекта повреждён")
+    prefix = raw[:PREFIX.itemsize].view(PREFIX)[0]
+    if prefix['magic'] != MAGIC:
+        raise ValueError("Это не файл проекта")
+    version = int(prefix['version'])
+    if version not in LAYOUTS:
+        raise ValueError(f"Версия файла проекта {version} не поддерживается")
+    header_dt, cargo_dt, box_dt = LAYOUTS[version]
+
+    pos = header_dt.itemsize
+    if raw.size < pos:
+        raise ValueError("Файл проекта повреждён")
+    header = raw[:pos].view(header_dt)[0]
+    sections = []
+    for dt, n in ((cargo_dt, int(header['n_cargos'])), (box_dt, int(header['n_boxes'])),
+                  (np.dtype('<u8'), int(header['n_strings']) + 1)):
+        end = pos + dt.itemsize * n
+        if end > raw.size:
+            raise ValueError("Файл проекта повреждён")
+        sections.append(raw[pos:end].view(dt))
+        pos = end
+    cargo_recs, boxes, offsets = sections
+    blob = raw[pos:].tobytes()
+    offsets = offsets.tolist()
+    names = [blob[a:b].decode("utf-8") for a, b in zip(offsets[:-1], offsets[1:])]
+
+    container = Container(float(header['length']), float(header['width']),
+                          float(header['height']), float(header['max_weight']))
+    cargos = [CargoType(int(r['id']), names[r['name']], int(r['qty']),
+                        int(r['length']), int(r['width']), int(r['height']),
+                        _number(r['weight']), upright=bool(r['upright']))
+              for r in cargo_recs]
+    return ProjectFile(version, container, cargos, boxes, names, max(1, int(header['n_plans'])))
+
+
+def load_plans(project, plans):
+    """Заполняет пустые plans грузами и коробками проекта (новые — через spawn).
+
+    Коробки каждого контейнера ставятся одним LoadPlan.place_many.
+    """
+    for c in project.cargos:
+        plans[0].add_cargo(c)
+    for i, (a, b) in enumerate(project.plan_slices()):
+        while i >= len(plans):
+            plans.append(plans[0].spawn())
+        rec = project.boxes[a:b]
+        s = plans[i].store
+        used = np.unique(rec['name'])
+        lut = np.zeros(int(used.max()) + 1 if used.size else 1, dtype=np.int32)
+        lut[used] = [s.intern(project.names[k]) for k in used.tolist()]
+        plans[i].place_many(rec['cargo_id'], rec['x'], rec['y'], rec['z'],
+                            rec['length'], rec['width'], rec['height'],
+                            rec['weight'], lut[rec['name']], rec['locked'].astype(bool))
+    return plans
@@ -0,0 +1,146 @@
+"""Перебор стратегий укладки в отдельных процессах.
+
+Задача для процесса — только данные (контейнер, грузы, уже стоящие
+коробки), результат — массивы новых коробок, так что дочерним процессам
+не нужны ни tkinter, ни объекты окна.
+"""
+import os
+import time
+from dataclasses import dataclass, field, replace
+
+import numpy as np
+
+from .model import LoadPlan
+from .packing import SORT_KEYS, SCORES, load_all
+
+# все сочетания порядка грузов и выбора точки, в порядке перебора
+STRATEGIES = [(order, score) for score in SCORES for order in SORT_KEYS]
+
+
+@dataclass
+class StrategyResult:
+    order: str
+    score: str
+    containers: int
+    fills: list                              # заполнение каждого контейнера, доли
+    left: int                                # коробок, не поместившихся никуда
+    added: dict = field(repr=False)          # номер контейнера -> массив (cargo_id, x, y, z, l, w, h)
+    elapsed: float = 0.0                     # с, внутри процесса
+    pid: int = 0
+    timed_out: bool = False
+
+    def rank(self):
+        """Меньше — лучше: всё уложено, меньше контейнеров, плотнее первые."""
+        return (self.left, self.containers, -sum(self.fills[:-1]), -self.fills[-1])
+
+
+def snapshot(plans, locked_only=False):
+    """Данные для run_strategy: копии грузов и стоящие коробки каждого плана.
+
+    locked_only — остаются только закреплённые коробки (остальные снова
+    считаются неразмещёнными), контейнеры в конце без них отбрасываются.
+    """
+    cargos = [replace(c, placed=0) for c in plans[0].cargos.values()]
+    boxes = []
+    for plan in plans:
+        s = plan.store
+        hs = s.handles()
+        if locked_only:
+            hs = hs[s.locked[hs]]
+        boxes.append(np.column_stack((s.cargo_id[hs], s.x[hs], s.y[hs], s.z[hs],
+                                      s.length[hs], s.width[hs], s.height[hs])))
+    while locked_only and len(boxes) > 1 and not len(boxes[-1]):
+        boxes.pop()
+    return plans[0].container, cargos, boxes
+
+
+def run_strategy(container, cargos, boxes, order, score, deadline):
+    """Восстанавливает планы из snapshot и дозагружает их стратегией (order, score).
+
+    deadline — общий для всех процессов момент time.time(), после которого
+    укладка обрывается и возвращается то, что успели.
+    """
+    t0 = time.perf_counter()
+    plans = restore(container, cargos, boxes)
+    added = load_all(plans, order, score, deadline)
+    return make_result(plans, added, order, score, time.perf_counter() - t0,
+                       time.time() > deadline)
+
+
+def restore(container, cargos, boxes):
+    """Планы из snapshot; грузы — свежие копии, чтобы snapshot не менялся.
+
+    Коробки каждого плана ставятся одним place_rows.
+    """
+    cargos = {c.id: replace(c) for c in cargos}
+    plans = []
+    for rows in boxes or [np.zeros((0, 7))]:
+        plan = LoadPlan(container, cargos)
+        place_rows(plan, rows)
+        plans.append(plan)
+    return plans
+
+
+def place_rows(plan, rows):
+    """Ставит коробки rows (cargo_id, x, y, z, l, w, h) одним LoadPlan.place_many.
+
+    Вес и имя — как у груза. Возвращает массив handle.
+    """
+    rows = np.asarray(rows, dtype=np.float64).reshape(-1, 7)
+    size = max(plan.cargos, default=0) + 1
+    weight = np.zeros(size)
+    names = np.zeros(size, dtype=np.int32)
+    if len(rows):
+        for c in plan.cargos.values():
+            weight[c.id] = c.weight
+            names[c.id] = plan.store.intern(c.name)
+    cid = rows[:, 0].astype(np.int64)
+    return plan.place_many(cid, *rows[:, 1:].T, weight[cid], names[cid], False)
+
+
+def make_result(plans, added, order, score, elapsed, timed_out=False):
+    """StrategyResult по планам и {номер плана: handle новых коробок}."""
+    out = {}
+    for i, hs in added.items():
+        s = plans[i].store
+        hs = np.asarray(hs, dtype=np.int64)
+        out[i] = np.column_stack((s.cargo_id[hs], s.x[hs], s.y[hs], s.z[hs],
+                                  s.length[hs], s.width[hs], s.height[hs]))
+    return StrategyResult(order, score, len(plans), [p.fill_ratio() for p in plans],
+                          sum(max(0, c.left) for c in plans[0].cargos.values()), out,
+                          elapsed, os.getpid(), timed_out)
+
+
+def submit_all(executor, plans, n, budget):
+    """Отправляет в executor первые n стратегий с общим бюджетом budget секунд.
+
+    Возвращает список futures.
+    """
+    container, cargos, boxes = snapshot(plans)
+    deadline = time.time() + budget
+    return [executor.submit(run_strategy, container, cargos, boxes, order, score, deadline)
+            for order, score in STRATEGIES[:n]]
+
+
+def submit_strategy(executor, plans, order, score, budget):
+    """Отправляет в executor одну стратегию (order, score) с бюджетом budget секунд.
+
+    Возвращает future.
+    """
+    container, cargos, boxes = snapshot(plans)
+    return executor.submit(run_strategy, container, cargos, boxes, order, score,
+                           time.time() + budget)
+
+
+def apply_result(plans, result):
+    """Ставит коробки результата в планы (новые контейнеры — через spawn).
+
+    Коробки каждого плана ставятся одним place_rows.
+    Возвращает {номер плана: массив handle новых коробок}.
+    """
+    added = {}
+    for i in sorted(result.added):
+        while i >= len(plans):
+            plans.append(plans[0].spawn())
+        added[i] = place_rows(plans[i], result.added[i])
+    return added
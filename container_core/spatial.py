@@ -0,0 +1,240 @@
+"""Пространственные индексы над InstanceStore: сетка по полу и карта высот."""
+import numpy as np
+
+GRID_CELL_MM = 500                            # шаг сетки пространственного индекса, мм
+HMAP_CELL_MM = 50                             # шаг карты высот пола, мм
+
+
+class SpatialGrid:
+    """Равномерная сетка по полу контейнера: ячейка -> handle коробок.
+
+    Каждая коробка регистрируется во всех ячейках, которые задевает её
+    проекция на пол. Запросы проверяют только коробки из задетых ячеек;
+    сами габариты берутся из InstanceStore.
+    """
+    def __init__(self, store, length, width, cell=GRID_CELL_MM):
+        self.store = store
+        self.cell = cell
+        self.nx = max(1, -(-int(length) // cell))
+        self.ny = max(1, -(-int(width) // cell))
+        self.cells = {}                      # (i, j) -> set(key)
+        self.spans = {}                      # key -> (i0, i1, j0, j1)
+
+    def __contains__(self, key):
+        return key in self.spans
+
+    def _span(self, x, y, l, w):
+        return (min(self.nx - 1, max(0, int(x // self.cell))),
+                min(self.nx - 1, max(0, int((x + l) // self.cell))),
+                min(self.ny - 1, max(0, int(y // self.cell))),
+                min(self.ny - 1, max(0, int((y + w) // self.cell))))
+
+    @staticmethod
+    def _cells(span):
+        i0, i1, j0, j1 = span
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                yield i, j
+
+    def insert(self, key):
+        x, y, _, l, w, _ = self.store.box(key)
+        span = self.spans[key] = self._span(x, y, l, w)
+        for ij in self._cells(span):
+            self.cells.setdefault(ij, set()).add(key)
+
+    def insert_many(self, keys):
+        """insert для массива ключей; ячейки считаются NumPy сразу для всех."""
+        s = self.store
+        x, y = s.x[keys], s.y[keys]
+        c = self.cell
+        i0 = np.clip(x // c, 0, self.nx - 1).astype(int).tolist()
+        i1 = np.clip((x + s.length[keys]) // c, 0, self.nx - 1).astype(int).tolist()
+        j0 = np.clip(y // c, 0, self.ny - 1).astype(int).tolist()
+        j1 = np.clip((y + s.width[keys]) // c, 0, self.ny - 1).astype(int).tolist()
+        cells = self.cells
+        for key, a, b, d, e in zip(np.asarray(keys).tolist(), i0, i1, j0, j1):
+            self.spans[key] = (a, b, d, e)
+            for i in range(a, b + 1):
+                for j in range(d, e + 1):
+                    bucket = cells.get((i, j))
+                    if bucket is None:
+                        cells[(i, j)] = {key}
+                    else:
+                        bucket.add(key)
+
+    def remove(self, key):
+        span = self.spans.pop(key, None)
+        if span is None:
+            return
+        for ij in self._cells(span):
+            bucket = self.cells.get(ij)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self.cells[ij]
+
+    def clear(self):
+        self.cells.clear()
+        self.spans.clear()
+
+    def query(self, x, y, l, w):
+        """Ключи-кандидаты, чьи ячейки пересекаются с прямоугольником на полу."""
+        found = set()
+        for ij in self._cells(self._span(x, y, l, w)):
+            bucket = self.cells.get(ij)
+            if bucket:
+                found |= bucket
+        return found
+
+    def _overlapping(self, x, y, l, w, exclude):
+        keys = self.query(x, y, l, w)
+        if exclude:
+            keys.difference_update(exclude)
+        cand = np.fromiter(keys, dtype=np.int64, count=len(keys))
+        s = self.store
+        mask = ((x < s.x[cand] + s.length[cand]) & (x + l > s.x[cand]) &
+                (y < s.y[cand] + s.width[cand]) & (y + w > s.y[cand]))
+        return cand[mask]
+
+    def top_z(self, x, y, l, w, exclude=()):
+        """Максимальная верхняя грань под прямоугольником (x, y, l, w)."""
+        cand = self._overlapping(x, y, l, w, exclude)
+        if not cand.size:
+            return 0
+        return float((self.store.z[cand] + self.store.height[cand]).max())
+
+    def top_z_many(self, x, y, ls, ws, exclude=()):
+        """top_z для нескольких площадок с общим углом (x, y) и сторонами ls × ws.
+
+        Кандидаты собираются одним запросом по самой большой площадке.
+        """
+        ls = np.asarray(ls, dtype=np.float64)
+        ws = np.asarray(ws, dtype=np.float64)
+        keys = self.query(x, y, ls.max(), ws.max())
+        if exclude:
+            keys.difference_update(exclude)
+        if not keys:
+            return np.zeros(ls.size)
+        cand = np.fromiter(keys, dtype=np.int64, count=len(keys))
+        s = self.store
+        bx, by = s.x[cand], s.y[cand]
+        over = ((x < bx + s.length[cand]) & (y < by + s.width[cand]) &
+                (x + ls[:, None] > bx) & (y + ws[:, None] > by))
+        return np.where(over, s.z[cand] + s.height[cand], 0).max(axis=1)
+
+    def collides(self, x, y, z, l, w, h, exclude=()):
+        cand = self._overlapping(x, y, l, w, exclude)
+        s = self.store
+        return bool(((z < s.z[cand] + s.height[cand]) & (z + h > s.z[cand])).any())
+
+# ----------------------------- Карта высот ------------------------------
+class HeightMap:
+    """Карта высот пола: в каждой ячейке — верх самой высокой коробки над ней.
+
+    Коробка помечает все ячейки, которые задевает (с запасом), поэтому
+    максимум по ячейкам, целиком лежащим под площадкой, точен, а спорные
+    краевые ячейки перепроверяются по SpatialGrid. Коробки из detached
+    (перетаскиваемая группа) в карту не входят.
+    """
+    def __init__(self, grid, length, width, cell=HMAP_CELL_MM):
+        self.grid = grid
+        self.cell = cell
+        self.nx = max(1, -(-int(length) // cell))
+        self.ny = max(1, -(-int(width) // cell))
+        self.top = np.zeros((self.nx, self.ny), dtype=np.float64)
+        self.detached = set()
+
+    def _outer(self, x, y, l, w):
+        c = self.cell
+        return (max(0, int(np.floor(x / c))), min(self.nx, int(np.ceil((x + l) / c))),
+                max(0, int(np.floor(y / c))), min(self.ny, int(np.ceil((y + w) / c))))
+
+    def _inner(self, x, y, l, w):
+        c = self.cell
+        return (max(0, int(np.ceil(x / c))), min(self.nx, int(np.floor((x + l) / c))),
+                max(0, int(np.ceil(y / c))), min(self.ny, int(np.floor((y + w) / c))))
+
+    def add(self, key):
+        if key in self.detached:
+            return
+        x, y, z, l, w, h = self.grid.store.box(key)
+        i0, i1, j0, j1 = self._outer(x, y, l, w)
+        window = self.top[i0:i1, j0:j1]
+        np.maximum(window, z + h, out=window)
+
+    def remove(self, key):
+        """Убирает коробку (пока она ещё есть в grid) и пересчитывает её окно."""
+        if key in self.detached or key not in self.grid:
+            return
+        x, y, _, l, w, _ = self.grid.store.box(key)
+        self._repaint(x, y, l, w, skip={key})
+
+    def _repaint(self, x, y, l, w, skip=()):
+        i0, i1, j0, j1 = self._outer(x, y, l, w)
+        self.top[i0:i1, j0:j1] = 0
+        c = self.cell
+        for key in self.grid.query(i0 * c, j0 * c, (i1 - i0) * c, (j1 - j0) * c):
+            if key in skip or key in self.detached:
+                continue
+            bx, by, bz, bl, bw, bh = self.grid.store.box(key)
+            a0, a1, b0, b1 = self._outer(bx, by, bl, bw)
+            a0, a1 = max(a0, i0), min(a1, i1)
+            b0, b1 = max(b0, j0), min(b1, j1)
+            if a0 < a1 and b0 < b1:
+                window = self.top[a0:a1, b0:b1]
+                np.maximum(window, bz + bh, out=window)
+
+    def detach(self, keys):
+        """Исключает коробки из карты (начало перетаскивания группы)."""
+        keys = [k for k in keys if k in self.grid and k not in self.detached]
+        self.detached.update(keys)
+        for key in keys:
+            x, y, _, l, w, _ = self.grid.store.box(key)
+            self._repaint(x, y, l, w)
+
+    def attach(self, keys):
+        for key in keys:
+            if key in self.detached:
+                self.detached.discard(key)
+                if key in self.grid:
+                    self.add(key)
+
+    def clear(self):
+        self.top.fill(0)
+        self.detached.clear()
+
+    def rebuild(self):
+        """Пересчитывает карту по всем коробкам grid (кроме detached).
+
+        Окна коробок считаются NumPy сразу для всех, в цикле — только максимум.
+        """
+        self.top.fill(0)
+        keys = np.fromiter((k for k in self.grid.spans if k not in self.detached), dtype=np.int64)
+        if not keys.size:
+            return
+        s = self.grid.store
+        c = self.cell
+        x, y = s.x[keys], s.y[keys]
+        i0 = np.maximum(0, np.floor(x / c)).astype(int).tolist()
+        i1 = np.minimum(self.nx, np.ceil((x + s.length[keys]) / c)).astype(int).tolist()
+        j0 = np.maximum(0, np.floor(y / c)).astype(int).tolist()
+        j1 = np.minimum(self.ny, np.ceil((y + s.width[keys]) / c)).astype(int).tolist()
+        tops = (s.z[keys] + s.height[keys]).tolist()
+        top = self.top
+        for a, b, d, e, t in zip(i0, i1, j0, j1, tops):
+            window = top[a:b, d:e]
+            np.maximum(window, t, out=window)
+
+    def top_z(self, x, y, l, w):
+        """Высота, на которую ляжет площадка (x, y, l, w), без detached."""
+        i0, i1, j0, j1 = self._outer(x, y, l, w)
+        if i0 >= i1 or j0 >= j1:
+            return 0
+        outer_max = float(self.top[i0:i1, j0:j1].max())
+        if outer_max == 0:
+            return 0
+        k0, k1, m0, m1 = self._inner(x, y, l, w)
+        inner_max = float(self.top[k0:k1, m0:m1].max()) if k0 < k1 and m0 < m1 else 0
+        if outer_max <= inner_max:
+            return inner_max
+        return self.grid.top_z(x, y, l, w, exclude=self.detached)
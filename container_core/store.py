@@ -0,0 +1,169 @@
+"""Хранилище размещённых коробок."""
+import numpy as np
+
+
+class InstanceStore:
+    """Размещённые коробки в виде столбцов NumPy (struct-of-arrays).
+
+    handle — номер строки; он не меняется, пока коробка размещена.
+    Строки удалённых коробок переиспользуются, имена хранятся один раз.
+    Суммарный вес, объём и моменты для центра тяжести ведутся нарастающим
+    итогом при каждом добавлении, удалении, перемещении и смене веса.
+    """
+    FLOAT_COLS = ('x', 'y', 'z', 'length', 'width', 'height', 'weight')
+    INT_COLS = ('cargo_id', 'name_id', 'orient')   # orient — номер поворота в model.ORIENTS
+    BOOL_COLS = ('locked',)                  # locked — поставлена вручную, перепланировка не трогает
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        for col in self.FLOAT_COLS:
+            setattr(self, col, np.zeros(capacity, dtype=np.float64))
+        for col in self.INT_COLS:
+            setattr(self, col, np.zeros(capacity, dtype=np.int32))
+        for col in self.BOOL_COLS:
+            setattr(self, col, np.zeros(capacity, dtype=bool))
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.extra = ()                      # столбцы, добавленные представлением
+        self.size = 0                        # занятые строки, включая свободные
+        self.free = []
+        self.names = []                      # name_id -> название
+        self.name_ids = {}
+        self._reset_totals()
+
+    def _reset_totals(self):
+        self.total_weight = 0.0              # кг
+        self.total_volume = 0.0              # мм³
+        self.moment = [0.0, 0.0, 0.0]        # Σm·x, Σm·y, Σm·z по центрам коробок
+
+    def _account(self, hnd, sign):
+        """Добавляет (sign=1) или вычитает (sign=-1) коробку(и) из итогов."""
+        m = self.weight[hnd]
+        l, w, h = self.length[hnd], self.width[hnd], self.height[hnd]
+        terms = (m, l * w * h, m * (self.x[hnd] + l / 2),
+                 m * (self.y[hnd] + w / 2), m * (self.z[hnd] + h / 2))
+        if np.ndim(hnd):                     # np.sum на скаляре заметно дороже
+            terms = [t.sum() for t in terms]
+        m, vol, mx, my, mz = (sign * float(t) for t in terms)
+        self.total_weight += m
+        self.total_volume += vol
+        self.moment[0] += mx
+        self.moment[1] += my
+        self.moment[2] += mz
+
+    def center_of_gravity(self):
+        if self.total_weight <= 0:
+            return None
+        return tuple(mom / self.total_weight for mom in self.moment)
+
+    def add_column(self, col, dtype=np.int32):
+        """Дополнительный столбец (например, id прямоугольников на холсте).
+
+        Растёт вместе с хранилищем и обнуляется при добавлении коробки.
+        """
+        if col not in self.extra:
+            setattr(self, col, np.zeros(self.capacity, dtype=dtype))
+            self.extra += (col,)
+
+    def __len__(self):
+        return self.size - len(self.free)
+
+    def _grow(self):
+        new_cap = self.capacity * 2
+        for col in self.FLOAT_COLS + self.INT_COLS + self.BOOL_COLS + self.extra + ('alive',):
+            old = getattr(self, col)
+            arr = np.zeros(new_cap, dtype=old.dtype)
+            arr[:self.capacity] = old
+            setattr(self, col, arr)
+        self.capacity = new_cap
+
+    def intern(self, name):
+        nid = self.name_ids.get(name)
+        if nid is None:
+            nid = self.name_ids[name] = len(self.names)
+            self.names.append(name)
+        return nid
+
+    def add(self, cargo_id, x, y, z, l, w, h, weight, name, locked=False, orient=0):
+        if self.free:
+            hnd = self.free.pop()
+        else:
+            if self.size == self.capacity:
+                self._grow()
+            hnd = self.size
+            self.size += 1
+        self.set_box(hnd, x, y, z, l, w, h)
+        self.weight[hnd] = weight
+        self.cargo_id[hnd] = cargo_id
+        self.name_id[hnd] = self.intern(name)
+        self.locked[hnd] = locked
+        self.orient[hnd] = orient
+        for col in self.extra:
+            getattr(self, col)[hnd] = 0
+        self.alive[hnd] = True
+        self._account(hnd, 1)
+        return hnd
+
+    def add_many(self, cargo_id, x, y, z, l, w, h, weight, name_id, locked, orient=0):
+        """Добавляет сразу n коробок в конец хранилища (свободные строки не занимает).
+
+        Аргументы — массивы длины n; name_id — уже из intern.
+        Возвращает массив handle.
+        """
+        n = len(x)
+        while self.size + n > self.capacity:
+            self._grow()
+        hs = np.arange(self.size, self.size + n)
+        self.size += n
+        for col, vals in (('cargo_id', cargo_id), ('x', x), ('y', y), ('z', z),
+                          ('length', l), ('width', w), ('height', h), ('weight', weight),
+                          ('name_id', name_id), ('locked', locked), ('orient', orient)):
+            getattr(self, col)[hs] = vals
+        for col in self.extra:
+            getattr(self, col)[hs] = 0
+        self.alive[hs] = True
+        if n:
+            self._account(hs, 1)
+        return hs
+
+    def remove(self, hnd):
+        if self.alive[hnd]:
+            self._account(hnd, -1)
+            self.alive[hnd] = False
+            self.free.append(hnd)
+            if len(self) == 0:               # не копим ошибку округления
+                self._reset_totals()
+
+    def clear(self):
+        self.alive[:] = False
+        self.size = 0
+        self.free.clear()
+        self._reset_totals()
+
+    def set_box(self, hnd, x, y, z, l, w, h):
+        live = self.alive[hnd]
+        if live:
+            self._account(hnd, -1)
+        self.x[hnd], self.y[hnd], self.z[hnd] = x, y, z
+        self.length[hnd], self.width[hnd], self.height[hnd] = l, w, h
+        if live:
+            self._account(hnd, 1)
+
+    def set_weight(self, hnds, weight):
+        hnds = hnds[self.alive[hnds]]
+        self._account(hnds, -1)
+        self.weight[hnds] = weight
+        self._account(hnds, 1)
+
+    def box(self, hnd):
+        return (float(self.x[hnd]), float(self.y[hnd]), float(self.z[hnd]),
+                float(self.length[hnd]), float(self.width[hnd]), float(self.height[hnd]))
+
+    def name(self, hnd):
+        return self.names[self.name_id[hnd]]
+
+    def handles(self, cargo_id=None):
+        """Массив handle размещённых коробок (всех или одного груза)."""
+        mask = self.alive[:self.size]
+        if cargo_id is not None:
+            mask = mask & (self.cargo_id[:self.size] == cargo_id)
+        return np.flatnonzero(mask)
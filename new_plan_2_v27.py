@@ -1,11 +1,23 @@
 # container_app.py
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import openpyxl
-from openpyxl import Workbook
 import re
 import os
-from PIL import Image, ImageTk
+import bisect
+import time
+import queue
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image, ImageDraw, ImageTk
+
+from container_core import (Container, CargoType, LoadPlan, replan,
+                            STRATEGIES, submit_all, submit_strategy, apply_result, start_anneal,
+                            open_rows, cargo_chunks,
+                            PROJECT_EXT, save_project, read_project, load_plans)
+from container_core.manifest import (CARGO_SHEET, PLACEMENT_SHEET, sheet_rows,
+                                     placement_chunks, write_workbook)
 
 INVALID_CHARS = re.compile(r'[,;*?<>|":\\/]')
 NON_ASCII = re.compile(r'[^\x00-\x7F]')
@@ -15,6 +27,25 @@ L40, W40, H40 = 32_200, 5_000, 5_000          # габариты контейн
 SCALE = 0.035                                 # px / mm
 MAX_WEIGHT_KG = 28_000
 MAX_VOLUME_M3 = 33.2                          # 20-футовый
+FRAME_MS = 16                                 # период кадра перетаскивания, мс
+SEARCH_POLL_MS = 100                          # опрос процессов перебора стратегий, мс
+LOAD_BUDGET_S = 120                           # предел фоновой раскладки по контейнерам, с
+TEXTURE_MEM_ITEMS = 12                        # готовых фонов в памяти (3 вида × 4 масштаба)
+TEXTURE_DISK_BYTES = 64 * 2**20               # предел кэша фонов на диске
+TEXTURE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "container_app", "textures")
+ZOOM_STEP = 2.0                               # шаг масштаба колесом (Ctrl)
+ZOOM_MAX = 16.0                               # предел увеличения вида
+BG_MAX_PX = 4096                              # фон крупнее не строится, а скрывается
+LOD_MIN_PX = 5                                # мельче (медиана видимых) — вид рисуется растровым слоем
+LAYER_DIRTY_MAX = 256                         # больше грязных прямоугольников за кадр — слой целиком
+ARCHIVE_ITEMS_MAX = 3000                      # больше видимых коробок архива — вид рисуется слоем
+VIEW_AXES = {'top': ('x', 'y'),               # вид -> оси холста по горизонтали и вертикали
+             'side': ('x', 'z'),
+             'front': ('y', 'z')}
+AXIS_SIZE = {'x': 'length', 'y': 'width', 'z': 'height'}
+AUTO_ORDERS = {"по объёму": 'volume',         # подпись в списке -> packing.SORT_KEYS
+               "по площади основания": 'footprint',
+               "по весу": 'weight'}
 
 # ----------------------------- Утилиты ----------------------------------
 def validate_name(name: str) -> str:
@@ -35,16 +66,41 @@ class ContainerApp:
 
         # рабочие переменные
         self.drag_instance = None
-        self.selected = set()                # (cargo_id, idx)
+        self.selected = set()                # handle из InstanceStore
+        self.painted = set()                 # handle, уже окрашенные как выделенные
         self.clipboard = []                  # [(cid, dx, dy, dz, l, w, h, wt, name), ...]
         self.select_rect = None
         self.select_start = None
         self.drag_mode = None
         self.drag_keys = []
+        self.drag_plan = None                # план, из карты высот которого сняты drag_keys
         self.drag_start_px = None
+        self.drag_pointer = None             # последняя позиция мыши, ещё не отрисованная
+        self.drag_frame_id = None
+        self.drag_stats = {}
+        self.search = None                   # идущий перебор стратегий
+        self.opt = None                      # идущая оптимизация отжигом
+        self.importing = None                # идущий потоковый импорт
+        self.archive = None                  # открытый только для просмотра проект
+        self.textures = TextureCache(TEXTURE_DIR)
+        self.zoom = dict.fromkeys(VIEW_AXES, 1.0)          # вид -> масштаб, 1 — весь контейнер
+        self.view_win = dict.fromkeys(VIEW_AXES)           # вид -> видимое окно в мм, None — всё
+        self.view_pending = set()            # виды, ждущие пересчёта видимых коробок
+        self.view_refresh_id = None
+        self.raster = dict.fromkeys(VIEW_AXES, False)      # вид показан растровым слоем
+        self.held = set()                    # невыделенная коробка, которую тащат мышью
+        self.layer_dirty = {mode: [] for mode in VIEW_AXES}   # вид -> bbox, ждущие перерисовки слоя
+
+        # модель загрузки; окно только показывает её
+        self.plan = LoadPlan(Container(L40, W40, H40, MAX_WEIGHT_KG))
+        self.plan.store.add_column('top_id')
+        self.plan.store.add_column('side_id')
+        self.plan.store.add_column('front_id')
+        self.plans = [self.plan]             # контейнеры отправки, self.plan — показанный
 
         # габариты контейнера
-        self.L, self.W, self.H = 32_200, 5_000, 5_000
+        c = self.plan.container
+        self.L, self.W, self.H = c.length, c.width, c.height
         self.tw = max(1, int(self.L * SCALE))
         self.th = max(1, int(self.W * SCALE))
         self.sw = max(1, int(self.L * SCALE))
@@ -52,17 +108,31 @@ class ContainerApp:
         self.fw = max(1, int(self.W * SCALE * 2))
         self.fh = max(1, int(self.H * SCALE * 2))
 
-        self.cargos = []
         self.counter = 1
         self.entries = {}
 
+        # прямоугольники на холстах
+        self.item_owner = {}                 # (canvas, id прямоугольника) -> handle
+        self.top_order = []                  # [(z, handle)] нарисованных на виде сверху, снизу вверх
+        self.top_key = {}                    # handle -> его ключ в top_order
+
         self.build_gui()
         self.root.bind_all("<KeyPress-r>", self.on_rotate_key)
+        self.root.bind_all("<KeyPress-l>", self.toggle_lock_selected)
         self.root.bind_all("<Control-c>", self.copy_selected)
         self.root.bind_all("<Control-v>", self.paste_clipboard)
         self.root.bind_all("<Delete>", self.delete_selected_rects)
+        self.root.bind_all("<Control-Key-0>", self.reset_zoom)
         self.tree.bind("<Double-1>", self.on_cell_double_click)
 
+    @property
+    def store(self):
+        return self.plan.store
+
+    @property
+    def cargos(self):
+        return self.plan.cargos
+
     # ------------------------------------------------------------------
     # Копирование / вставка
     # ------------------------------------------------------------------
@@ -70,25 +140,27 @@ class ContainerApp:
         if not self.selected:
             return
         self.clipboard.clear()
-        min_x = min(self.cargos[cid - 1]['instances'][idx]['x'] for cid, idx in self.selected)
-        min_y = min(self.cargos[cid - 1]['instances'][idx]['y'] for cid, idx in self.selected)
-        for cid, idx in self.selected:
-            cargo = next(c for c in self.cargos if c['id'] == cid)
-            inst = cargo['instances'][idx]
+        s = self.store
+        sel = np.fromiter(self.selected, dtype=np.int64)
+        min_x = s.x[sel].min()
+        min_y = s.y[sel].min()
+        for hnd in sel:
             self.clipboard.append((
-                cid,
-                inst['x'] - min_x,
-                inst['y'] - min_y,
-                inst['z'],
-                inst['length'],
-                inst['width'],
-                inst['height'],
-                inst['weight'],
-                inst['name']
+                int(s.cargo_id[hnd]),
+                float(s.x[hnd] - min_x),
+                float(s.y[hnd] - min_y),
+                float(s.z[hnd]),
+                float(s.length[hnd]),
+                float(s.width[hnd]),
+                float(s.height[hnd]),
+                float(s.weight[hnd]),
+                s.name(hnd)
             ))
         messagebox.showinfo("Копировать", f"Скопировано {len(self.clipboard)} коробок")
 
     def paste_clipboard(self, event=None):
+        if self._edit_blocked():
+            return
         if not self.clipboard:
             return
         # какой canvas под курсором
@@ -108,123 +180,137 @@ class ContainerApp:
         if canvas_under is None:
             return
 
-        # координаты в мм
-        if mode == 'front':
-            x_mm = (cx - 10) / (SCALE * 2)
-            y_mm = ((canvas_under.winfo_height() - 20) - (cy - 10)) / (SCALE * 2)
-        else:
-            x_mm = (cx - 10) / SCALE
-            y_mm = ((canvas_under.winfo_height() - 20) - (cy - 10)) / SCALE
+        # координаты в мм (с учётом масштаба и прокрутки вида)
+        x_mm, y_mm = self._to_mm(mode, cx, cy)
 
         for cid, dx, dy, dz, l, w_box, h_box, wt, name in self.clipboard:
-            cargo = next(c for c in self.cargos if c['id'] == cid)
+            cargo = self.cargos.get(cid)
+            if cargo is None:                # груз удалён после копирования
+                continue
             if mode == 'top':
-                new_x = max(0, min(self.L - l, x_mm - dx))
-                new_y = max(0, min(self.W - w_box, y_mm - dy))
-                new_z = self.drop_z(new_x, new_y, l, w_box)
+                new_x, new_y, new_z = x_mm - dx, y_mm - dy, 0
             elif mode == 'side':
-                new_x = max(0, min(self.L - l, x_mm - dx))
-                new_y = max(0, min(self.W - w_box, 0))
-                new_z = max(0, min(self.H - h_box, y_mm - dz))
+                new_x, new_y, new_z = x_mm - dx, 0, y_mm - dz
             else:   # front
-                new_x = max(0, min(self.L - l, 0))
-                new_y = max(0, min(self.W - w_box, x_mm - dy))
-                new_z = max(0, min(self.H - h_box, y_mm - dz))
-
-            inst = {
-                'x': new_x, 'y': new_y, 'z': new_z,
-                'length': l, 'width': w_box, 'height': h_box,
-                'name': name, 'weight': wt
-            }
-            tag_suffix = len(cargo.get('instances', []))
-            inst['top_id'] = self.top_canvas.create_rectangle(
-                10 + new_x * SCALE, 10 + (self.W - w_box - new_y) * SCALE,
-                10 + (new_x + l) * SCALE, 10 + (self.W - new_y) * SCALE,
-                fill="#0078D4", outline="black",
-                tags=("cargo", f"{cid}_{tag_suffix}"))
-            inst['side_id'] = self.side_canvas.create_rectangle(
-                10 + new_x * SCALE, 10 + (self.H - h_box - new_z) * SCALE,
-                10 + (new_x + l) * SCALE, 10 + (self.H - new_z) * SCALE,
-                fill="#0078D4", outline="black",
-                tags=("cargo", f"{cid}_{tag_suffix}"))
-            inst['front_id'] = self.front_canvas.create_rectangle(
-                10 + new_y * SCALE * 2, 10 + (self.H - h_box - new_z) * SCALE * 2,
-                10 + (new_y + w_box) * SCALE * 2, 10 + (self.H - new_z) * SCALE * 2,
-                fill="#0078D4", outline="black",
-                tags=("cargo", f"{cid}_{tag_suffix}"))
-            cargo.setdefault('instances', []).append(inst)
-            cargo['placed'] += 1
+                new_x, new_y, new_z = 0, x_mm - dy, y_mm - dz
+            new_x, new_y, new_z = self.plan.clamp(new_x, new_y, new_z, l, w_box, h_box)
+            if mode == 'top':
+                new_z = self.plan.drop_z(new_x, new_y, l, w_box)
+
+            self.add_instance(cargo, new_x, new_y, new_z, l, w_box, h_box,
+                              name=name, weight=wt)
             self.refresh_tree_row(cargo)
         self.update_status()
-        self.reorder_top_canvas()
 
     # ------------------------------------------------------------------
     # Переупорядочивание top-вид сверху по z
     # ------------------------------------------------------------------
     def reorder_top_canvas(self):
-        items = [(inst['z'], inst['top_id'])
-                 for c in self.cargos
-                 for inst in c.get('instances', [])]
-        items.sort(key=lambda t: t[0], reverse=True)
-        for _, top_id in items:
+        """Полная пересборка стопки вида сверху — для массовых операций."""
+        s = self.store
+        hs = s.handles()
+        hs = hs[s.top_id[hs] != 0]                       # 0 — коробка не нарисована
+        order = hs[np.lexsort((hs, s.z[hs]))]
+        self.top_order = list(zip(s.z[order].tolist(), order.tolist()))
+        self.top_key = {key[1]: key for key in self.top_order}
+        for top_id in s.top_id[order].tolist():
             self.top_canvas.lift(top_id)
         # рамка всегда сверху
         self.top_canvas.lift("select_rect")
 
+    def _top_order_remove(self, hnd):
+        key = self.top_key.pop(hnd, None)
+        if key is not None:
+            del self.top_order[bisect.bisect_left(self.top_order, key)]
+
+    def restack_top(self, hnd):
+        """Переставляет одну коробку в стопке вида сверху: выше соседа снизу по z.
+
+        В top_order только нарисованные коробки, так что соседи находятся
+        одним bisect.
+        """
+        self._top_order_remove(hnd)
+        ids = self.store.top_id
+        item = int(ids[hnd])
+        if not item:
+            return
+        key = (float(self.store.z[hnd]), hnd)
+        pos = bisect.bisect_left(self.top_order, key)
+        self.top_order.insert(pos, key)
+        self.top_key[hnd] = key
+        if pos > 0:
+            self.top_canvas.tag_raise(item, int(ids[self.top_order[pos - 1][1]]))
+        elif pos + 1 < len(self.top_order):
+            self.top_canvas.tag_lower(item, int(ids[self.top_order[pos + 1][1]]))
+
     # ------------------------------------------------------------------
     # Рамка выделения
     # ------------------------------------------------------------------
     def select_start_rect(self, evt, mode):
+        if self.archive is not None:         # в архиве выделять нечего
+            return
         if not (evt.state & 0x0001):
             self.clear_selection()
         self.select_mode = mode
-        self.select_start = (evt.x, evt.y)
         canv = getattr(self, f"{mode}_canvas")
+        self.select_start = (canv.canvasx(evt.x), canv.canvasy(evt.y))
         canv.delete("select_rect")
 
     def select_drag_rect(self, evt, mode):
+        if not self.select_start:
+            return
         canv = getattr(self, f"{mode}_canvas")
         canv.delete("select_rect")
         x0, y0 = self.select_start
         canv.create_rectangle(
-            x0, y0, evt.x, evt.y,
+            x0, y0, canv.canvasx(evt.x), canv.canvasy(evt.y),
             outline="green", width=2, dash=(4, 2), tags="select_rect")
         canv.lift("select_rect")
 
     def select_end_rect(self, evt, mode):
         if not self.select_start:
             return
+        if self.archive is not None:         # архив открыли посреди выделения
+            self.select_start = None
+            getattr(self, f"{mode}_canvas").delete("select_rect")
+            return
         canv = getattr(self, f"{mode}_canvas")
         canv.delete("select_rect")
         x0, y0 = self.select_start
-        x1, y1 = evt.x, evt.y
+        x1, y1 = canv.canvasx(evt.x), canv.canvasy(evt.y)
         x0, x1 = min(x0, x1), max(x0, x1)
         y0, y1 = min(y0, y1), max(y0, y1)
 
-        new_selection = set()
-        for c in self.cargos:
-            for idx, inst in enumerate(c.get('instances', [])):
-                px0, py0, px1, py1 = self._inst_bbox(inst, mode)
-                if not (x1 < px0 or x0 > px1 or y1 < py0 or y0 > py1):
-                    new_selection.add((c['id'], idx))
-        self.selected = new_selection
+        hs = self.store.handles()
+        px0, py0, px1, py1 = self._inst_bbox(hs, mode)
+        hit = ~((x1 < px0) | (x0 > px1) | (y1 < py0) | (y0 > py1))
+        self.selected = set(hs[hit].tolist())
         self.recolor_selected()
         self.select_start = None
 
     def clear_selection(self, evt=None):
         for canvas in (self.top_canvas, self.side_canvas, self.front_canvas):
             canvas.delete("select_rect")
-        for cid, idx in list(self.selected):
-            cargo = next(c for c in self.cargos if c['id'] == cid)
-            if idx < len(cargo.get('instances', [])):
-                inst = cargo['instances'][idx]
-                self.top_canvas.itemconfig(inst['top_id'], fill="#0078D4")
-                self.side_canvas.itemconfig(inst['side_id'], fill="#0078D4")
-                self.front_canvas.itemconfig(inst['front_id'], fill="#0078D4")
+        for canvas in (self.top_canvas, self.side_canvas, self.front_canvas):
+            canvas.itemconfig("selected", fill="#0078D4")
+            canvas.dtag("selected")
+        painted, self.painted = self.painted, set()
         self.selected.clear()
+        if any(self.raster.values()):        # снятые с выделения уходят обратно в слой
+            for hnd in painted:
+                self.redraw_instance(hnd)
 
-    def _inst_bbox(self, inst, mode):
-        x, y, z, l, w, h = inst['x'], inst['y'], inst['z'], inst['length'], inst['width'], inst['height']
+    def _inst_bbox(self, hnd, mode):
+        """Прямоугольник коробки (или массива коробок) на холсте mode, px."""
+        s = self.store
+        return self._bbox(s.x[hnd], s.y[hnd], s.z[hnd],
+                          s.length[hnd], s.width[hnd], s.height[hnd], mode)
+
+    def _bbox(self, x, y, z, l, w, h, mode):
+        """Прямоугольник по координатам и габаритам (числа или массивы), px.
+
+        Координаты — холста, с учётом масштаба вида; прокрутка их не меняет.
+        """
         if mode == 'top':
             px0 = 10 + x * SCALE
             py0 = 10 + (self.W - w - y) * SCALE
@@ -240,20 +326,108 @@ class ContainerApp:
             py0 = 10 + (self.H - h - z) * SCALE * 2
             px1 = 10 + (y + w) * SCALE * 2
             py1 = 10 + (self.H - z) * SCALE * 2
-        return px0, py0, px1, py1
+        zf = self.zoom[mode]
+        return px0 * zf, py0 * zf, px1 * zf, py1 * zf
+
+    def _visible_mm(self, mode):
+        """Видимая часть холста mode в мм: (a0, a1, b0, b1) по осям вида.
+
+        Оси: сверху — x, y; сбоку — x, z; спереди — y, z.
+        """
+        canvas = getattr(self, f"{mode}_canvas")
+        w, h = self._viewport_px(canvas)
+        return self._px_window_mm(mode, canvas.canvasx(0), canvas.canvasx(w),
+                                  canvas.canvasy(0), canvas.canvasy(h))
+
+    def _px_to_mm(self, mode, px, py):
+        """Точка холста mode (координаты холста, px) -> мм по осям вида."""
+        k = SCALE * 2 if mode == 'front' else SCALE
+        zf = self.zoom[mode]
+        far = self.W if mode == 'top' else self.H     # вертикальная ось холста перевёрнута
+        return (px / zf - 10) / k, far - (py / zf - 10) / k
+
+    def _px_window_mm(self, mode, px0, px1, py0, py1):
+        """Прямоугольник холста, px -> окно (a0, a1, b0, b1) в мм по осям вида."""
+        a0, b1 = self._px_to_mm(mode, px0, py0)
+        a1, b0 = self._px_to_mm(mode, px1, py1)
+        return a0, a1, b0, b1
+
+    @staticmethod
+    def _viewport_px(canvas):
+        """Размер окна холста, px; до первого показа winfo_* ещё 1 — тогда заказанный."""
+        return (max(canvas.winfo_width(), int(float(canvas.cget("width")))),
+                max(canvas.winfo_height(), int(float(canvas.cget("height")))))
+
+    def _to_mm(self, mode, ex, ey):
+        """Точка окна холста mode -> координаты в мм по осям вида."""
+        canvas = getattr(self, f"{mode}_canvas")
+        return self._px_to_mm(mode, canvas.canvasx(ex), canvas.canvasy(ey))
+
+    def _view_size(self, mode):
+        """Размер контейнера на холсте mode при масштабе 1, px (без полей)."""
+        return {'top': (self.tw, self.th),
+                'side': (self.sw, self.sh),
+                'front': (self.fw, self.fh)}[mode]
+
+    def _in_view(self, hnd, mode):
+        """True, если коробка задевает видимую область вида mode."""
+        win = self.view_win[mode]
+        if win is None:
+            return True
+        s = self.store
+        (ax, bx), (a0, a1, b0, b1) = VIEW_AXES[mode], win
+        a, b = getattr(s, ax)[hnd], getattr(s, bx)[hnd]
+        return bool(a < a1 and a + getattr(s, AXIS_SIZE[ax])[hnd] > a0 and
+                    b < b1 and b + getattr(s, AXIS_SIZE[bx])[hnd] > b0)
+
+    def _wants_item(self, hnd, mode):
+        """Нужен ли коробке живой прямоугольник на холсте mode.
+
+        В растровом виде прямоугольники есть только у выделенных и
+        перетаскиваемых коробок, остальные нарисованы слоем.
+        """
+        if not self._in_view(hnd, mode):
+            return False
+        return not self.raster[mode] or hnd in self.painted or hnd in self.held
 
     def recolor_selected(self):
-        for c in self.cargos:
-            for idx, inst in enumerate(c.get('instances', [])):
-                color = "#00B050" if (c['id'], idx) in self.selected else "#0078D4"
-                self.top_canvas.itemconfig(inst['top_id'], fill=color)
-                self.side_canvas.itemconfig(inst['side_id'], fill=color)
-                self.front_canvas.itemconfig(inst['front_id'], fill=color)
+        """Перекрашивает только коробки, чьё выделение изменилось.
+
+        Выделенные прямоугольники несут тег "selected", поэтому цвет
+        ставится одним itemconfig на холст.
+        """
+        added = self.selected - self.painted
+        removed = self.painted - self.selected
+        if not added and not removed:
+            return
+        s = self.store
+        for canvas, ids in ((self.top_canvas, s.top_id),
+                            (self.side_canvas, s.side_id),
+                            (self.front_canvas, s.front_id)):
+            for hnd in removed:
+                item = int(ids[hnd])
+                if item:
+                    canvas.dtag(item, "selected")
+                    canvas.addtag_withtag("deselected", item)
+            for hnd in added:
+                if ids[hnd]:                 # невидимые окрасятся при появлении
+                    canvas.addtag_withtag("selected", int(ids[hnd]))
+            if removed:
+                canvas.itemconfig("deselected", fill="#0078D4")
+                canvas.dtag("deselected")
+            if added:
+                canvas.itemconfig("selected", fill="#00B050")
+        self.painted = set(self.selected)
+        if any(self.raster.values()):        # в растровом виде живы только выделенные
+            for hnd in added | removed:
+                self.redraw_instance(hnd)
 
     # ------------------------------------------------------------------
     # Остальной код (перетаскивание, поворот, удаление, экспорт, импорт, редактирование)
     # ------------------------------------------------------------------
     def on_cell_double_click(self, event):
+        if self._edit_blocked():
+            return
         region = self.tree.identify("region", event.x, event.y)
         if region != "cell":
             return
@@ -263,6 +437,11 @@ class ContainerApp:
             return
         editable_cols = ("name", "qty", "l", "w", "h", "wt")
         col_index = int(col_id.replace("#", "")) - 1
+        if col_index == 8:                   # "Верх" переключается без поля ввода
+            cargo = self.cargos[int(row_id)]
+            cargo.upright = not cargo.upright
+            self.refresh_tree_row(cargo)
+            return
         if col_index >= len(editable_cols):
             return
         col_key = editable_cols[col_index]
@@ -289,30 +468,22 @@ class ContainerApp:
         new_val = self.edit_entry.get().strip()
         try:
             col = self._edit_col_key
-            cargo = next(c for c in self.cargos if str(c['id']) == self._edit_row_id)
+            cargo = self.cargos[int(self._edit_row_id)]
             if col == "name":
                 new_val = validate_name(new_val)
-                cargo['name'] = new_val
             else:
-                new_val = int(new_val)      # отрицательные допустимы
-                if col == "qty":
-                    cargo['qty'] = new_val
-                elif col == "l":
-                    cargo['length'] = new_val
-                elif col == "w":
-                    cargo['width'] = new_val
-                elif col == "h":
-                    cargo['height'] = new_val
-                elif col == "wt":
-                    cargo['weight'] = new_val
+                new_val = int(new_val)
+            field = {"name": "name", "qty": "qty", "l": "length", "w": "width",
+                     "h": "height", "wt": "weight"}[col]
+            if field in ("length", "width", "height", "weight") and new_val <= 0:
+                raise ValueError("Габариты и вес должны быть больше нуля")
 
             self.tree.set(self._edit_row_id, self._edit_col_id, new_val)
-            if col in ("l", "w", "h"):
-                for inst in cargo.get('instances', []):
-                    inst['length'] = cargo['length']
-                    inst['width'] = cargo['width']
-                    inst['height'] = cargo['height']
-                    self.move_instance_to(inst, inst['x'], inst['y'], inst['z'])
+            for plan in self.plans:
+                if plan is not self.plan:
+                    plan.update_cargo(cargo.id, field, new_val)
+            for hnd in self.plan.update_cargo(cargo.id, field, new_val).tolist():
+                self.redraw_instance(hnd)
             self.update_status()
             self.refresh_tree_row(cargo)
         except ValueError as e:
@@ -326,24 +497,18 @@ class ContainerApp:
         self.__dict__.pop('edit_entry', None)
 
     def delete_selected_rects(self, event=None):
-        if not self.selected:
+        if not self.selected or self._edit_blocked():
             return
-        for cid, idx in sorted(self.selected, key=lambda x: x[1], reverse=True):
-            cargo = next((c for c in self.cargos if c['id'] == cid), None)
-            if not cargo or idx >= len(cargo.get('instances', [])):
+        for hnd in list(self.selected):
+            if not self.store.alive[hnd]:
                 continue
-            inst = cargo['instances'][idx]
-            for canv in (self.top_canvas, self.side_canvas, self.front_canvas):
-                canv.delete(inst['top_id'])
-                canv.delete(inst['side_id'])
-                canv.delete(inst['front_id'])
-            cargo['instances'].pop(idx)
-            cargo['placed'] = max(0, cargo['placed'] - 1)
-            self.refresh_tree_row(cargo)
+            cargo = self.cargos.get(int(self.store.cargo_id[hnd]))
+            self.remove_instance(hnd)
+            if cargo:
+                self.refresh_tree_row(cargo)
         self.selected.clear()
         self.recolor_selected()
         self.update_status()
-        self.reorder_top_canvas()
 
     # ------------------------- GUI ------------------------------------
     def build_gui(self):
@@ -375,6 +540,9 @@ class ContainerApp:
             e.pack()
             self.entries[txt] = e
 
+        self.upright_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(frm, text="Этой стороной вверх", variable=self.upright_var).pack(anchor='w', padx=5)
+
         btns = tk.Frame(left)
         btns.pack(fill=tk.X, pady=5)
 
@@ -384,6 +552,20 @@ class ContainerApp:
         tk.Button(row1, text="Экспорт",   command=self.export_xlsx,  width=12).pack(side=tk.LEFT, padx=3)
         tk.Button(row1, text="Импорт",    command=self.import_xlsx,  width=12).pack(side=tk.LEFT, padx=3)
 
+        row1b = tk.Frame(btns)
+        row1b.pack()
+        tk.Button(row1b, text="Сохранить проект", command=self.save_project_file,
+                  width=18).pack(side=tk.LEFT, padx=3)
+        tk.Button(row1b, text="Открыть проект", command=self.open_project_file,
+                  width=18).pack(side=tk.LEFT, padx=3)
+
+        row1c = tk.Frame(btns)
+        row1c.pack()
+        tk.Button(row1c, text="Просмотр архива", command=self.open_archive,
+                  width=18).pack(side=tk.LEFT, padx=3)
+        tk.Button(row1c, text="Закрыть архив", command=self.close_archive,
+                  width=18).pack(side=tk.LEFT, padx=3)
+
         row2 = tk.Frame(btns)
         row2.pack()
         tk.Button(row2, text="Разместить", command=self.place_selected, width=12).pack(side=tk.LEFT, padx=3)
@@ -394,15 +576,76 @@ class ContainerApp:
         row3.pack()
         tk.Button(row3, text="Разместить партию", command=self.place_batch, width=36).pack(pady=3)
 
+        row4 = tk.Frame(btns)
+        row4.pack()
+        self.auto_order = ttk.Combobox(row4, values=list(AUTO_ORDERS), state="readonly", width=22)
+        self.auto_order.current(0)
+        self.auto_order.pack(side=tk.LEFT, padx=3)
+        tk.Button(row4, text="Загрузить всё", command=self.auto_load, width=12).pack(side=tk.LEFT, padx=3)
+
+        row5 = tk.Frame(btns)
+        row5.pack()
+        self.container_box = ttk.Combobox(row5, values=["Контейнер 1"], state="readonly", width=22)
+        self.container_box.current(0)
+        self.container_box.pack(side=tk.LEFT, padx=3)
+        self.container_box.bind("<<ComboboxSelected>>",
+                                lambda e: self.show_container(self.container_box.current()))
+        tk.Button(row5, text="По контейнерам", command=self.load_containers, width=12).pack(side=tk.LEFT, padx=3)
+
+        row6 = tk.Frame(btns)
+        row6.pack()
+        tk.Label(row6, text="Стратегий:").pack(side=tk.LEFT)
+        self.strat_n = tk.Spinbox(row6, from_=1, to=len(STRATEGIES), width=3)
+        self.strat_n.delete(0, tk.END)
+        self.strat_n.insert(0, str(len(STRATEGIES)))
+        self.strat_n.pack(side=tk.LEFT)
+        tk.Label(row6, text="Бюджет, с:").pack(side=tk.LEFT)
+        self.strat_budget = tk.Spinbox(row6, from_=1, to=600, width=4)
+        self.strat_budget.delete(0, tk.END)
+        self.strat_budget.insert(0, "10")
+        self.strat_budget.pack(side=tk.LEFT)
+        tk.Button(row6, text="Перебор", command=self.search_strategies, width=10).pack(side=tk.LEFT, padx=3)
+
+        row7 = tk.Frame(btns)
+        row7.pack()
+        tk.Label(row7, text="Оптимизация, с:").pack(side=tk.LEFT)
+        self.opt_budget = tk.Spinbox(row7, from_=1, to=3600, width=5)
+        self.opt_budget.delete(0, tk.END)
+        self.opt_budget.insert(0, "30")
+        self.opt_budget.pack(side=tk.LEFT)
+        tk.Button(row7, text="Оптимизировать", command=self.optimize, width=14).pack(side=tk.LEFT, padx=3)
+        tk.Button(row7, text="Стоп", command=self.stop_optimize, width=6).pack(side=tk.LEFT, padx=3)
+
+        row8 = tk.Frame(btns)
+        row8.pack()
+        tk.Button(row8, text="Закрепить (L)", command=self.toggle_lock_selected, width=16).pack(side=tk.LEFT, padx=3)
+        tk.Button(row8, text="Дозаполнить вокруг стоящих", command=self.replan,
+                  width=30).pack(side=tk.LEFT, padx=3)
+        # растровая отрисовка: неподвижные коробки — одной картинкой на вид
+        self.composite_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(btns, text="Растровая отрисовка (живы только выделенные)",
+                       variable=self.composite_var,
+                       command=self.toggle_composite).pack(anchor='w', padx=5)
+
         self.status_lbl = tk.Label(left, text="Вес: 0 / 28 000 кг   Объём: 0 / 33 м³")
         self.status_lbl.pack(pady=5)
+        self.perf_lbl = tk.Label(left, text="", fg="gray40")
+        self.perf_lbl.pack()
+
+        # прогресс импорта; показывается только во время импорта
+        self.import_frame = tk.Frame(left)
+        self.import_bar = ttk.Progressbar(self.import_frame, length=220, mode="determinate")
+        self.import_bar.pack(side=tk.LEFT, padx=3)
+        tk.Button(self.import_frame, text="Отмена", command=self.cancel_import,
+                  width=8).pack(side=tk.LEFT, padx=3)
 
         self.tree = ttk.Treeview(
             left,
-            columns=("name", "qty", "l", "w", "h", "wt", "placed", "left"),
+            columns=("name", "qty", "l", "w", "h", "wt", "placed", "left", "up"),
             show="headings", height=10)
-        for col, text in zip(("name", "qty", "l", "w", "h", "wt", "placed", "left"),
-                             ("Название", "Кол-во", "Длина", "Ширина", "Высота", "Вес", "Размещено", "Осталось")):
+        for col, text in zip(("name", "qty", "l", "w", "h", "wt", "placed", "left", "up"),
+                             ("Название", "Кол-во", "Длина", "Ширина", "Высота", "Вес", "Размещено", "Осталось",
+                              "Верх")):
             self.tree.heading(col, text=text)
             self.tree.column(col, width=80, anchor="center")
         self.tree.pack(fill=tk.BOTH, expand=True)
@@ -441,6 +684,22 @@ class ContainerApp:
             canv.bind("<B3-Motion>", lambda e, t=tag: self.select_drag_rect(e, t))
             canv.bind("<ButtonRelease-3>", lambda e, t=tag: self.select_end_rect(e, t))
             canv.bind("<Double-1>", self.remove_from_canvas)
+            # масштаб — Ctrl+колесо, прокрутка — колесо (Shift — по горизонтали)
+            # или перетаскивание средней кнопкой
+            canv.bind("<Control-MouseWheel>",
+                      lambda e, t=tag: self.zoom_view(t, ZOOM_STEP if e.delta > 0 else 1 / ZOOM_STEP,
+                                                      e.x, e.y))
+            canv.bind("<Control-Button-4>", lambda e, t=tag: self.zoom_view(t, ZOOM_STEP, e.x, e.y))
+            canv.bind("<Control-Button-5>", lambda e, t=tag: self.zoom_view(t, 1 / ZOOM_STEP, e.x, e.y))
+            canv.bind("<MouseWheel>", lambda e, t=tag: self.scroll_view(t, 'y', -1 if e.delta > 0 else 1))
+            canv.bind("<Shift-MouseWheel>",
+                      lambda e, t=tag: self.scroll_view(t, 'x', -1 if e.delta > 0 else 1))
+            canv.bind("<Button-4>", lambda e, t=tag: self.scroll_view(t, 'y', -1))
+            canv.bind("<Button-5>", lambda e, t=tag: self.scroll_view(t, 'y', 1))
+            canv.bind("<Shift-Button-4>", lambda e, t=tag: self.scroll_view(t, 'x', -1))
+            canv.bind("<Shift-Button-5>", lambda e, t=tag: self.scroll_view(t, 'x', 1))
+            canv.bind("<Button-2>", lambda e: e.widget.scan_mark(e.x, e.y))
+            canv.bind("<B2-Motion>", lambda e, t=tag: self.pan_view(t, e.x, e.y))
 
         self.draw_containers()
 
@@ -452,16 +711,16 @@ class ContainerApp:
             base_dir = os.path.dirname(os.path.abspath(__file__))
             bg_dir = os.path.join(base_dir, "resources")
             self.bg_img = {}
+            self.bg_item = {}                # вид -> id картинки фона на холсте
+            self.bg_path = {}
             for key, fname in (('top', 'top.png'), ('side', 'side.png'), ('front', 'front.png')):
                 path = os.path.join(bg_dir, fname)
                 if not os.path.exists(path):
                     raise FileNotFoundError(path)
-                img = Image.open(path).convert("RGBA")
-                size = {'top': (self.tw, self.th),
-                        'side': (self.sw, self.sh),
-                        'front': (self.fw, self.fh)}[key]
-                self.bg_img[key] = ImageTk.PhotoImage(img.resize(size, Image.LANCZOS))
-                getattr(self, f"{key}_canvas").create_image(10, 10, anchor='nw', image=self.bg_img[key])
+                self.bg_path[key] = path
+                self.bg_img[key] = self.textures.get(path, self._view_size(key))
+                self.bg_item[key] = getattr(self, f"{key}_canvas").create_image(
+                    10, 10, anchor='nw', image=self.bg_img[key])
         except FileNotFoundError as e:
             messagebox.showerror("Файл не найден", str(e))
 
@@ -469,11 +728,20 @@ class ContainerApp:
                            (self.side_canvas, self.sw, self.sh),
                            (self.front_canvas, self.fw, self.fh)):
             canv.create_rectangle(10, 10, 10 + w, 10 + h, width=2, outline="black")
+            canv.config(scrollregion=(0, 0, 20 + w, 20 + h))
+        # растровый слой неподвижных коробок: над фоном, под прямоугольниками
+        self.layer_img = {}
+        self.layer_pil = {}                  # вид -> картинка слоя PIL (её правит _repaint_layer)
+        self.layer_org = {}                  # вид -> точка холста левого верхнего угла слоя
+        self.layer_item = {mode: getattr(self, f"{mode}_canvas").create_image(
+            0, 0, anchor='nw', state="hidden") for mode in VIEW_AXES}
 
     # ------------------------------------------------------------------
     # CRUD
     # ------------------------------------------------------------------
     def add_to_table(self):
+        if self._edit_blocked():
+            return
         try:
             name = validate_name(self.entries["Название"].get())
             qty = int(self.entries["Количество"].get())
@@ -486,113 +754,200 @@ class ContainerApp:
             if l > self.L or w > self.W or h > self.H:
                 messagebox.showerror("Ошибка", "Габариты превышают контейнер")
                 return
-            cargo = {
-                'id': self.counter,
-                'name': name,
-                'qty': qty,
-                'length': l, 'width': w, 'height': h, 'weight': wt,
-                'placed': 0,
-                'instances': []
-            }
-            self.cargos.append(cargo)
-            self.tree.insert("", "end", iid=str(self.counter),
-                             values=(name, qty, l, w, h, wt, 0, qty))
+            cargo = self.plan.add_cargo(CargoType(self.counter, name, qty, l, w, h, wt,
+                                                  upright=self.upright_var.get()))
+            self.tree.insert("", "end", iid=str(self.counter))
+            self.refresh_tree_row(cargo)
             self.counter += 1
             for e in self.entries.values():
                 e.delete(0, tk.END)
+            self.upright_var.set(False)
             self.entries["Название"].focus_set()
         except ValueError:
             messagebox.showerror("Ошибка", "Проверьте ввод")
 
+    @staticmethod
+    def _tree_values(cargo):
+        return (cargo.name, cargo.qty,
+                cargo.length, cargo.width, cargo.height,
+                cargo.weight, cargo.placed, cargo.left,
+                "да" if cargo.upright else "")
+
     def refresh_tree_row(self, cargo):
-        left = cargo['qty'] - cargo['placed']
-        self.tree.item(str(cargo['id']),
-                       values=(cargo['name'], cargo['qty'],
-                               cargo['length'], cargo['width'], cargo['height'],
-                               cargo['weight'], cargo['placed'], left))
+        self.tree.item(str(cargo.id), values=self._tree_values(cargo))
 
     def delete_selected(self):
+        if self._edit_blocked():
+            return
         sel = self.tree.selection()
         if not sel:
             messagebox.showerror("Ошибка", "Выберите груз для удаления")
             return
         cid = int(sel[0])
-        cargo = next((c for c in self.cargos if c['id'] == cid), None)
+        cargo = self.cargos.get(cid)
         if not cargo:
             return
-        for inst in cargo.get('instances', []):
-            for canv in (self.top_canvas, self.side_canvas, self.front_canvas):
-                canv.delete(inst['top_id'])
-                canv.delete(inst['side_id'])
-                canv.delete(inst['front_id'])
+        for hnd in self.store.handles(cid).tolist():
+            self.erase_instance(hnd)
+        for plan in self.plans:
+            plan.remove_cargo(cid)
         self.tree.delete(sel[0])
-        self.cargos = [c for c in self.cargos if c['id'] != cid]
         self.update_status()
-        self.reorder_top_canvas()
 
     def place_selected(self):
+        if self._edit_blocked():
+            return
         sel = self.tree.selection()
         if not sel:
             messagebox.showerror("Ошибка", "Выберите груз в таблице")
             return
-        cid = int(sel[0])
-        cargo = next(c for c in self.cargos if c['id'] == cid)
-        x = (self.L - cargo['length']) // 2
-        y = (self.W - cargo['width']) // 2
-        z = self.drop_z(x, y, cargo['length'], cargo['width'])
-
-        inst = {
-            'x': x, 'y': y, 'z': z,
-            'length': cargo['length'], 'width': cargo['width'], 'height': cargo['height'],
-            'name': cargo['name'], 'weight': cargo['weight']
-        }
-        tag_suffix = len(cargo.get('instances', []))
-        inst['top_id'] = self.top_canvas.create_rectangle(
-            10 + x * SCALE, 10 + (self.W - inst['width'] - y) * SCALE,
-            10 + (x + inst['length']) * SCALE, 10 + (self.W - y) * SCALE,
-            fill="#0078D4", outline="black",
-            tags=("cargo", f"{cid}_{tag_suffix}"))
-        inst['side_id'] = self.side_canvas.create_rectangle(
-            10 + x * SCALE, 10 + (self.H - inst['height'] - z) * SCALE,
-            10 + (x + inst['length']) * SCALE, 10 + (self.H - z) * SCALE,
-            fill="#0078D4", outline="black",
-            tags=("cargo", f"{cid}_{tag_suffix}"))
-        inst['front_id'] = self.front_canvas.create_rectangle(
-            10 + y * SCALE * 2, 10 + (self.H - inst['height'] - z) * SCALE * 2,
-            10 + (y + inst['width']) * SCALE * 2, 10 + (self.H - z) * SCALE * 2,
-            fill="#0078D4", outline="black",
-            tags=("cargo", f"{cid}_{tag_suffix}"))
-        cargo.setdefault('instances', []).append(inst)
-        cargo['placed'] += 1
+        cargo = self.cargos[int(sel[0])]
+        x = (self.L - cargo.length) // 2
+        y = (self.W - cargo.width) // 2
+        z = self.plan.drop_z(x, y, cargo.length, cargo.width)
+        self.add_instance(cargo, x, y, z, *cargo.dims)
         self.refresh_tree_row(cargo)
         self.update_status()
-        self.reorder_top_canvas()
 
-    def remove_from_canvas(self, evt):
-        canvas = evt.widget
+    def add_instance(self, cargo, x, y, z, l, w, h, name=None, weight=None,
+                     restack=True):
+        """Размещает экземпляр груза в плане и рисует его в трёх видах.
+
+        Коробки, поставленные вручную, сразу закреплены (см. replan).
+        restack=False — для массовых операций: порядок на виде сверху
+        выставит один последующий вызов reorder_top_canvas.
+        """
+        hnd = self.plan.place(cargo.id, x, y, z, l, w, h, weight=weight, name=name, locked=True)
+        self.draw_instance(hnd, restack)
+        return hnd
+
+    def _make_item(self, hnd, mode):
+        """Создаёт прямоугольник коробки на холсте mode и запоминает его id."""
+        s = self.store
+        canvas = getattr(self, f"{mode}_canvas")
+        tags = ("cargo", f"{int(s.cargo_id[hnd])}_{hnd}")
+        fill = "#0078D4"
+        if hnd in self.painted:
+            tags += ("selected",)
+            fill = "#00B050"
+        width = 2 if s.locked[hnd] else 1    # закреплённые — жирной рамкой
+        item = canvas.create_rectangle(*self._inst_bbox(hnd, mode), fill=fill, outline="black",
+                                       width=width, tags=tags)
+        getattr(s, f"{mode}_id")[hnd] = item
+        self.item_owner[(canvas, item)] = hnd
+        return item
+
+    def _drop_item(self, hnd, mode):
+        """Снимает прямоугольник коробки с холста mode (id становится 0)."""
+        ids = getattr(self.store, f"{mode}_id")
+        item = int(ids[hnd])
+        if item:
+            canvas = getattr(self, f"{mode}_canvas")
+            canvas.delete(item)
+            self.item_owner.pop((canvas, item), None)
+            ids[hnd] = 0
+            if mode == 'top':
+                self._top_order_remove(hnd)
+
+    def draw_instance(self, hnd, restack=True):
+        """Рисует коробку на тех холстах, где она попадает в видимую область.
+
+        В растровом виде коробка дорисовывается в слой в ближайшем кадре.
+        """
+        for mode in VIEW_AXES:
+            if self._wants_item(hnd, mode):
+                self._make_item(hnd, mode)
+            else:
+                getattr(self.store, f"{mode}_id")[hnd] = 0
+                if self.raster[mode]:
+                    self._layer_dirty(mode, hnd)
+        if restack:
+            self.restack_top(hnd)
+
+    def redraw_instance(self, hnd, restack=False):
+        """Двигает прямоугольники коробки; ушедшие из видимой области снимает, вошедшие — рисует."""
+        s = self.store
+        for mode in VIEW_AXES:
+            item = int(getattr(s, f"{mode}_id")[hnd])
+            if not self._wants_item(hnd, mode):
+                if item:                                 # живая коробка уходит в слой
+                    self._drop_item(hnd, mode)
+                    if self.raster[mode]:
+                        self._layer_dirty(mode, hnd)
+                elif self.raster[mode] and hnd not in self.painted and hnd not in self.held:
+                    # сдвинута внутри слоя: где была — неизвестно; выделенные
+                    # и удерживаемые в слой не входят, их перерисовывать незачем
+                    self._schedule_refresh(mode)
+            elif item:
+                getattr(self, f"{mode}_canvas").coords(item, *self._inst_bbox(hnd, mode))
+            else:
+                self._make_item(hnd, mode)
+                restack = restack or mode == 'top'
+                if self.raster[mode]:                    # коробку надо убрать из слоя
+                    self._layer_dirty(mode, hnd)
+        if restack:
+            self.restack_top(hnd)
+
+    def erase_instance(self, hnd):
+        """Убирает прямоугольники коробки с холстов; план не трогает."""
+        for mode in VIEW_AXES:
+            if self.raster[mode] and not getattr(self.store, f"{mode}_id")[hnd]:
+                self._layer_dirty(mode, hnd)             # коробка была в слое
+            self._drop_item(hnd, mode)
+        self.selected.discard(hnd)
+        self.painted.discard(hnd)
+
+    def remove_instance(self, hnd):
+        """Удаляет коробку с холстов и из плана."""
+        self.erase_instance(hnd)
+        self.plan.remove(hnd)
+
+    def draw_added(self, hnds):
+        """Рисует много новых коробок сразу: по виду — один refresh_view.
+
+        Так вид заново решает, рисовать ли прямоугольниками или слоем,
+        и не создаёт прямоугольников, которые тут же пришлось бы снять.
+        """
+        hnds = np.asarray(hnds, dtype=np.int64)
+        for mode in VIEW_AXES:
+            getattr(self.store, f"{mode}_id")[hnds] = 0
+            self.refresh_view(mode)
+
+    def instance_at(self, canvas, item_id):
+        """handle коробки, которой принадлежит прямоугольник item_id на canvas."""
+        return self.item_owner.get((canvas, item_id))
+
+    def instance_under(self, canvas, ex, ey):
+        """handle коробки под точкой (ex, ey) окна холста или None.
+
+        Сначала — прямоугольник под курсором; в растровом виде, если его
+        нет, — коробка слоя в этой точке, нарисованная последней.
+        """
         items = canvas.find_withtag("current")
-        if not items:
-            return
-        clicked_id = items[0]
-        cargo = None
-        for c in self.cargos:
-            for inst in c.get('instances', []):
-                if clicked_id in (inst['top_id'], inst['side_id'], inst['front_id']):
-                    cargo = c
-                    break
-            if cargo:
-                break
-        if not cargo:
+        if items:
+            hnd = self.instance_at(canvas, items[0])
+            if hnd is not None:
+                return hnd
+        mode = next(m for m in VIEW_AXES if getattr(self, f"{m}_canvas") is canvas)
+        if not self.raster[mode] or self.archive is not None:
+            return None
+        a, b = self._to_mm(mode, ex, ey)
+        ax, bx = VIEW_AXES[mode]
+        hs = self.plan.window(ax, a, a, bx, b, b)
+        if not hs.size:
+            return None
+        if mode == 'top':                    # порядок слоя: по z, затем по handle
+            return int(hs[np.lexsort((hs, self.store.z[hs]))[-1]])
+        return int(hs.max())
+
+    def remove_from_canvas(self, evt):
+        hnd = self.instance_under(evt.widget, evt.x, evt.y)
+        if hnd is None or self._edit_blocked():
             return
-        for canv in (self.top_canvas, self.side_canvas, self.front_canvas):
-            canv.delete(inst['top_id'])
-            canv.delete(inst['side_id'])
-            canv.delete(inst['front_id'])
-        cargo['instances'].remove(inst)
-        cargo['placed'] = max(0, cargo['placed'] - 1)
+        cargo = self.cargos[int(self.store.cargo_id[hnd])]
+        self.remove_instance(hnd)
         self.refresh_tree_row(cargo)
         self.update_status()
-        self.reorder_top_canvas()
 
     def export_xlsx(self):
         if not self.cargos:
@@ -601,250 +956,1170 @@ class ContainerApp:
         f = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel", "*.xlsx")])
         if not f:
             return
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Грузы"
-        ws.append(["№", "Название", "Количество", "Длина (мм)", "Ширина (мм)", "Высота (мм)", "Вес (кг)"])
-        for c in self.cargos:
-            ws.append([c['id'], c['name'], c['qty'],
-                       c['length'], c['width'], c['height'], c['weight']])
-        wb.save(f)
+        try:
+            write_workbook(f, self.cargos.values(), self.plans)
+        except Exception as e:
+            messagebox.showerror("Ошибка экспорта", str(e))
+            return
         messagebox.showinfo("Готово", f"Сохранено в {f}")
 
     def import_xlsx(self):
+        """Потоковый импорт: книга читается в read-only режиме пачками строк.
+
+        Каждая пачка разбирается, добавляется в cargos одним update и в
+        таблицу — за один проход таймера, так что окно не замирает.
+        Затем, если в книге есть лист размещения и контейнеры пусты,
+        так же пачками восстанавливаются коробки.
+        """
+        if self._archive_open():
+            return
+        if self.importing is not None:
+            messagebox.showerror("Ошибка", "Импорт уже идёт")
+            return
         f = filedialog.askopenfilename(filetypes=[("Excel", "*.xlsx")])
         if not f:
             return
         try:
-            wb = openpyxl.load_workbook(f, data_only=True)
-            ws = wb.active
-            for row in ws.iter_rows(min_row=2, values_only=True):
-                if not row or len(row) < 7 or not all(row[:7]):
-                    continue
-                _, name, qty, l, w, h, wt = row[:7]
-                cargo = {
-                    'id': self.counter,
-                    'name': str(name),
-                    'qty': int(qty),
-                    'length': int(l), 'width': int(w), 'height': int(h),
-                    'weight': int(wt),
-                    'placed': 0,
-                    'instances': []
-                }
-                self.cargos.append(cargo)
-                self.tree.insert("", "end", iid=str(self.counter),
-                                 values=(name, qty, l, w, h, wt, 0, qty))
-                self.counter += 1
+            rows, total, wb = open_rows(f, CARGO_SHEET)
+        except Exception as e:
+            messagebox.showerror("Ошибка импорта", str(e))
+            return
+        id_map = {}                          # № в файле -> id груза
+        self.importing = {
+            'wb': wb,
+            'chunks': cargo_chunks(rows, self.counter, id_map=id_map),
+            'id_map': id_map,
+            'phase': 'cargos',
+            'total': total,
+            'ids': [],                       # id импортированных грузов — для отмены
+            'boxes': 0,
+            'skipped': 0,
+            'cancel': False,
+            't0': time.perf_counter(),
+        }
+        self.import_bar.config(maximum=max(1, total), value=0)
+        self.import_frame.pack(pady=3)
+        self.root.after(1, self._import_step)
+
+    def _import_step(self):
+        st = self.importing
+        if st['cancel']:
+            self._finish_import()
+            if st['phase'] == 'boxes':       # до импорта контейнеры были пусты
+                for plan in self.plans:
+                    plan.clear()
+                del self.plans[1:]
+                self._after_restore()
+            for cid in st['ids']:
+                self.cargos.pop(cid, None)
+            self.tree.delete(*map(str, st['ids']))
+            self.perf_lbl.config(text="Импорт отменён")
+            return
+        try:
+            chunk, read, skipped = next(st['chunks'])
+        except StopIteration:
+            if st['phase'] == 'cargos' and self._start_restore():
+                self.root.after(1, self._import_step)
+                return
+            self._finish_import()
+            if st['phase'] == 'boxes':
+                self._after_restore()
+            text = (f"Импорт: {len(st['ids'])} грузов, {st['boxes']} коробок за "
+                    f"{time.perf_counter() - st['t0']:.1f} с, пропущено строк {st['skipped']}")
+            if st.get('note'):
+                text += "\n" + st['note']
+            self.perf_lbl.config(text=text)
+            return
         except Exception as e:
+            self._finish_import()
+            if st['phase'] == 'boxes':
+                self._after_restore()
             messagebox.showerror("Ошибка импорта", str(e))
+            return
+        if st['phase'] == 'boxes':
+            self._restore_chunk(chunk)
+            self.import_bar.config(maximum=max(st['total'], read, 1), value=read)
+            self.perf_lbl.config(text=f"Импорт размещения: {read} / {st['total'] or '?'} коробок")
+            st['skipped'] = st['cargo_skipped'] + skipped
+            self.root.after(1, self._import_step)
+            return
+        # все планы делят один словарь грузов
+        self.cargos.update((c.id, c) for c in chunk)
+        for c in chunk:
+            self.tree.insert("", "end", iid=str(c.id), values=self._tree_values(c))
+        st['ids'] += [c.id for c in chunk]
+        st['skipped'] = skipped
+        if chunk:
+            self.counter = chunk[-1].id + 1
+        self.import_bar.config(maximum=max(st['total'], read, 1), value=read)
+        self.perf_lbl.config(text=f"Импорт: {read} / {st['total'] or '?'} строк")
+        self.root.after(1, self._import_step)
+
+    def _start_restore(self):
+        """Переходит к листу размещения; False — восстанавливать нечего."""
+        st = self.importing
+        found = sheet_rows(st['wb'], PLACEMENT_SHEET)
+        if found is None:
+            return False
+        if any(len(p.store) for p in self.plans):
+            st['note'] = "размещение не восстановлено: в контейнерах уже есть коробки"
+            return False
+        rows, st['total'] = found
+        st['chunks'] = placement_chunks(rows, st['id_map'])
+        st['phase'] = 'boxes'
+        st['cargo_skipped'] = st['skipped']
+        self.import_bar.config(maximum=max(1, st['total']), value=0)
+        return True
+
+    def _restore_chunk(self, chunk):
+        """Ставит пачку коробок из листа размещения; рисуются они в конце."""
+        st = self.importing
+        for i, cid, x, y, z, l, w, h, locked in chunk:
+            while i >= len(self.plans):
+                self.plans.append(self.plans[0].spawn())
+            self.plans[i].place(cid, x, y, z, l, w, h, locked=locked)
+        st['boxes'] += len(chunk)
+
+    def _after_restore(self):
+        """Показывает восстановленные контейнеры и обновляет таблицу."""
+        self.plan = self.plans[0]
+        self.container_box.config(values=[f"Контейнер {i + 1}" for i in range(len(self.plans))])
+        self.container_box.current(0)
+        self.redraw_plan()
+        for c in self.cargos.values():
+            self.refresh_tree_row(c)
+
+    def cancel_import(self):
+        """Прерывает импорт; уже добавленные им грузы убираются."""
+        if self.importing is not None:
+            self.importing['cancel'] = True
+
+    def _finish_import(self):
+        self.importing['wb'].close()
+        self.importing = None
+        self.import_frame.pack_forget()
+
+    # ------------------------------------------------------------------
+    # Файл проекта
+    # ------------------------------------------------------------------
+    def save_project_file(self):
+        """Сохраняет грузы и все контейнеры в двоичный файл проекта."""
+        f = filedialog.asksaveasfilename(defaultextension=PROJECT_EXT,
+                                         filetypes=[("Проект", "*" + PROJECT_EXT)])
+        if not f:
+            return
+        t0 = time.perf_counter()
+        try:
+            save_project(f, self.plans)
+        except OSError as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
+        self.perf_lbl.config(text=f"Проект сохранён за {(time.perf_counter() - t0) * 1000:.0f} мс")
+
+    def open_project_file(self):
+        """Заменяет текущую загрузку содержимым файла проекта."""
+        if self._archive_open():
+            return
+        if self.opt is not None or self.search is not None or self.importing is not None:
+            messagebox.showerror("Ошибка", "Дождитесь окончания поиска или импорта")
+            return
+        f = filedialog.askopenfilename(filetypes=[("Проект", "*" + PROJECT_EXT)])
+        if not f:
+            return
+        t0 = time.perf_counter()
+        try:
+            project = read_project(f)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
+        c = project.container
+        if (c.length, c.width, c.height) != (self.L, self.W, self.H):
+            messagebox.showerror("Ошибка", "Проект сохранён для другого контейнера")
+            return
+        read_ms = (time.perf_counter() - t0) * 1000
+        for plan in self.plans:
+            plan.clear()
+        del self.plans[1:]
+        self.plan = self.plans[0]
+        self.cargos.clear()
+        self.clipboard.clear()               # id грузов проекта начинаются заново
+        self.tree.delete(*self.tree.get_children())
+        load_plans(project, self.plans)
+        for cargo in self.cargos.values():
+            self.tree.insert("", "end", iid=str(cargo.id), values=self._tree_values(cargo))
+        self.counter = max(self.cargos, default=0) + 1
+        self.container_box.config(values=[f"Контейнер {i + 1}" for i in range(len(self.plans))])
+        self.container_box.current(0)
+        self.redraw_plan()
+        self.perf_lbl.config(
+            text=f"Проект: {len(self.cargos)} грузов, {len(project.boxes)} коробок, "
+                 f"чтение {read_ms:.0f} мс, всего {(time.perf_counter() - t0) * 1000:.0f} мс")
+
+    # ------------------------------------------------------------------
+    # Просмотр архива
+    # ------------------------------------------------------------------
+    def open_archive(self):
+        """Открывает файл проекта только для просмотра, не загружая коробки.
+
+        Записи коробок остаются в отображённом файле; на холсты попадают
+        лишь коробки показанного контейнера, задевающие видимую область.
+        """
+        if self._archive_open():
+            return
+        if self.opt is not None or self.search is not None or self.importing is not None:
+            messagebox.showerror("Ошибка", "Дождитесь окончания поиска или импорта")
+            return
+        f = filedialog.askopenfilename(filetypes=[("Проект", "*" + PROJECT_EXT)])
+        if not f:
+            return
+        t0 = time.perf_counter()
+        try:
+            project = read_project(f)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
+        c = project.container
+        if (c.length, c.width, c.height) != (self.L, self.W, self.H):
+            messagebox.showerror("Ошибка", "Проект сохранён для другого контейнера")
+            return
+        self.archive = {
+            'project': project,
+            'slices': project.plan_slices(),
+            'name': os.path.basename(f),
+            'open_ms': (time.perf_counter() - t0) * 1000,
+            'raster': dict.fromkeys(VIEW_AXES, False),   # вид -> нарисован слоем
+        }
+        self.clear_selection()
+        self.container_box.config(values=[f"Архив: контейнер {i + 1}"
+                                          for i in range(len(self.archive['slices']))])
+        self.container_box.current(0)
+        self.draw_archive(0)
+
+    def draw_archive(self, index, modes=tuple(VIEW_AXES)):
+        """Рисует видимые коробки контейнера index архива на холстах modes.
+
+        Как и для загрузки: если видимых коробок больше ARCHIVE_ITEMS_MAX
+        или они мельче LOD_MIN_PX, вид рисуется одним растровым слоем,
+        прямоугольники — только при достаточном увеличении.
+        Возвращает число видимых коробок.
+        """
+        st = self.archive
+        st['index'] = index
+        t0 = time.perf_counter()
+        project, bounds = st['project'], st['slices'][index]
+        drawn = layered = 0
+        for mode in modes:
+            axes = VIEW_AXES[mode]
+            canvas = getattr(self, f"{mode}_canvas")
+            canvas.delete("cargo")
+            canvas.itemconfig(self.layer_item[mode], state="hidden")
+            a0, a1, b0, b1 = self._visible_mm(mode)
+            rec = project.window(bounds, axes[0], a0, a1, axes[1], b0, b1)
+            if mode == 'top':                # выше лежащие — поверх
+                rec = rec[np.argsort(rec['z'] + rec['height'], kind='stable')]
+            boxes = np.column_stack(self._bbox(rec['x'], rec['y'], rec['z'], rec['length'],
+                                               rec['width'], rec['height'], mode))
+            st['raster'][mode] = (self.composite_var.get() or len(rec) > ARCHIVE_ITEMS_MAX or
+                                  self._small_sizes(rec[AXIS_SIZE[axes[0]]],
+                                                    rec[AXIS_SIZE[axes[1]]], mode))
+            if st['raster'][mode]:
+                self.layer_dirty[mode] = []  # слой теперь архивный: правки загрузки не в счёт
+                img, x0, y0 = self._layer_image(mode)
+                self._paint_rects(img, boxes, rec['locked'], x0, y0)
+                self._show_layer(mode, img, x0, y0)
+                layered += len(rec)
+                continue
+            for bbox in boxes.tolist():
+                canvas.create_rectangle(*bbox, fill="#0078D4", outline="black",
+                                        tags=("cargo", "archive"))
+            drawn += len(rec)
+        total = bounds[1] - bounds[0]
+        self.status_lbl.config(
+            text=f"Архив {st['name']}: контейнер {index + 1} из {len(st['slices'])}, "
+                 f"коробок {total}")
+        self.perf_lbl.config(
+            text=f"Архив открыт за {st['open_ms']:.0f} мс; на холстах {drawn} прямоугольников, "
+                 f"в слое {layered} коробок за {(time.perf_counter() - t0) * 1000:.0f} мс")
+        return drawn + layered
+
+    def close_archive(self):
+        """Возвращает на холсты текущую загрузку."""
+        if self.archive is None:
+            return
+        self.archive = None
+        self.container_box.config(values=[f"Контейнер {i + 1}" for i in range(len(self.plans))])
+        self.container_box.current(self.plans.index(self.plan))
+        self.redraw_plan()
+
+    def _archive_open(self):
+        """True (с сообщением), если показан архив: загрузку тогда не правим."""
+        if self.archive is None:
+            return False
+        messagebox.showerror("Ошибка", "Сначала закройте просмотр архива")
+        return True
+
+    def _edit_blocked(self):
+        """True (с сообщением), если загрузку сейчас править нельзя.
+
+        Так бывает, пока показан архив или идёт импорт: отмена импорта
+        убирает всё, что он добавил, и не должна задеть правки поверх.
+        """
+        if self._archive_open():
+            return True
+        if self.importing is None:
+            return False
+        messagebox.showerror("Ошибка", "Дождитесь окончания импорта или отмените его")
+        return True
+
+    # ------------------------------------------------------------------
+    # Масштаб и прокрутка видов
+    # ------------------------------------------------------------------
+    def zoom_view(self, mode, factor, ex, ey):
+        """Меняет масштаб вида mode в factor раз; точка под курсором (ex, ey) стоит на месте.
+
+        Уже нарисованные прямоугольники масштабирует сам холст (canvas.scale),
+        затем видимая область пересчитывается через refresh_view.
+        """
+        canvas = getattr(self, f"{mode}_canvas")
+        old = self.zoom[mode]
+        new = min(ZOOM_MAX, max(1.0, old * factor))
+        if new == old:
+            return
+        t0 = time.perf_counter()
+        f = new / old
+        cx, cy = canvas.canvasx(ex), canvas.canvasy(ey)
+        canvas.scale("all", 0, 0, f, f)
+        self.zoom[mode] = new
+        w, h = self._view_size(mode)
+        width, height = (w + 20) * new, (h + 20) * new
+        canvas.config(scrollregion=(0, 0, width, height))
+        canvas.xview_moveto((cx * f - ex) / width)
+        canvas.yview_moveto((cy * f - ey) / height)
+        self._scale_background(mode)
+        shown = self.refresh_view(mode)
+        raster = self.raster[mode] if self.archive is None else self.archive['raster'][mode]
+        how = "слоем" if raster else "прямоугольниками"
+        self.perf_lbl.config(
+            text=f"Масштаб ×{new:g}: видно {shown} коробок, {how}, "
+                 f"за {(time.perf_counter() - t0) * 1000:.0f} мс")
+
+    def toggle_composite(self):
+        """Переключает растровую отрисовку на всех видах."""
+        if self.archive is not None:
+            return
+        for mode in VIEW_AXES:
+            self.refresh_view(mode)
+
+    def reset_zoom(self, evt=None):
+        """Возвращает все виды к масштабу 1 (весь контейнер)."""
+        for mode in VIEW_AXES:
+            self.zoom_view(mode, 1 / self.zoom[mode], 0, 0)
+
+    def _scale_background(self, mode):
+        """Фон вида под текущий масштаб; слишком крупный не строится, а скрывается."""
+        item = self.bg_item.get(mode)
+        if item is None:
+            return
+        canvas = getattr(self, f"{mode}_canvas")
+        zf = self.zoom[mode]
+        w, h = self._view_size(mode)
+        size = (int(w * zf), int(h * zf))
+        if max(size) > BG_MAX_PX:
+            canvas.itemconfig(item, state="hidden")
+            return
+        self.bg_img[mode] = self.textures.get(self.bg_path[mode], size)
+        canvas.itemconfig(item, image=self.bg_img[mode], state="normal")
+
+    def scroll_view(self, mode, axis, units):
+        canvas = getattr(self, f"{mode}_canvas")
+        if axis == 'x':
+            canvas.xview_scroll(units, "units")
+        else:
+            canvas.yview_scroll(units, "units")
+        self._schedule_refresh(mode)
+
+    def pan_view(self, mode, ex, ey):
+        getattr(self, f"{mode}_canvas").scan_dragto(ex, ey, gain=1)
+        self._schedule_refresh(mode)
+
+    def _schedule_refresh(self, mode):
+        """Пересчёт видимых коробок — не чаще раза в кадр, как и перетаскивание."""
+        self.view_pending.add(mode)
+        self._schedule_frame()
+
+    def _layer_dirty(self, mode, hnd):
+        """Отмечает место коробки на слое вида mode для перерисовки в ближайшем кадре."""
+        self.layer_dirty[mode].append(self._inst_bbox(hnd, mode))
+        self._schedule_frame()
+
+    def _schedule_frame(self):
+        if self.view_refresh_id is None:
+            self.view_refresh_id = self.root.after(FRAME_MS, self._refresh_pending)
+
+    def _refresh_pending(self):
+        self.view_refresh_id = None
+        modes, self.view_pending = self.view_pending, set()
+        for mode in modes:
+            self.refresh_view(mode)              # слой рисуется заново целиком
+        for mode in VIEW_AXES:
+            if self.layer_dirty[mode]:
+                self._repaint_layer(mode)
+
+    def refresh_view(self, mode):
+        """Приводит прямоугольники холста mode к его видимой области.
+
+        Какие коробки видны, отвечает пространственный запрос плана
+        (LoadPlan.window); ушедшие из области снимаются с холста, вошедшие
+        рисуются. На масштабе 1 виден весь контейнер, и отбора нет.
+        Если видимые коробки мельче LOD_MIN_PX или включена растровая
+        отрисовка, вид переходит на растровый слой: прямоугольники остаются
+        только у выделенных и перетаскиваемых.
+        Возвращает число видимых коробок.
+        """
+        if self.archive is not None:
+            return self.draw_archive(self.archive['index'], (mode,))
+        s = self.store
+        canvas = getattr(self, f"{mode}_canvas")
+        ids = getattr(s, f"{mode}_id")
+        hs = s.handles()
+        have = hs[ids[hs] != 0]
+        if self.zoom[mode] == 1:
+            self.view_win[mode] = None
+            shown = hs
+        else:
+            win = self.view_win[mode] = self._visible_mm(mode)
+            ax, bx = VIEW_AXES[mode]
+            shown = self.plan.window(ax, win[0], win[1], bx, win[2], win[3])
+        self.raster[mode] = self.composite_var.get() or self._small_boxes(shown, mode)
+        if self.raster[mode]:
+            live = np.fromiter(self.painted | self.held, dtype=np.int64)
+            want = np.intersect1d(shown, live)
+        else:
+            want = shown
+        gone = np.setdiff1d(have, want, assume_unique=True)
+        new = np.setdiff1d(want, have, assume_unique=True)
+        if gone.size:
+            items = ids[gone].tolist()
+            canvas.delete(*items)
+            for item in items:
+                self.item_owner.pop((canvas, item), None)
+            ids[gone] = 0
+            if mode == 'top':
+                self.top_order = [key for key in self.top_order if ids[key[1]]]
+                self.top_key = {key[1]: key for key in self.top_order}
+        for hnd in new.tolist():
+            self._make_item(hnd, mode)
+        self._render_layer(mode, np.setdiff1d(shown, want, assume_unique=True))
+        if mode == 'top' and (new.size or len(self.top_order) != want.size):
+            self.reorder_top_canvas()
+        return shown.size
+
+    def _small_boxes(self, hs, mode):
+        """True, если коробки hs на холсте mode в основном мельче LOD_MIN_PX (по медиане)."""
+        s = self.store
+        ax, bx = VIEW_AXES[mode]
+        return self._small_sizes(getattr(s, AXIS_SIZE[ax])[hs], getattr(s, AXIS_SIZE[bx])[hs], mode)
+
+    def _small_sizes(self, a, b, mode):
+        """_small_boxes по массивам сторон a, b (мм) вдоль осей вида mode."""
+        if not len(a):
+            return False
+        k = (SCALE * 2 if mode == 'front' else SCALE) * self.zoom[mode]
+        return float(np.median(np.minimum(a, b) * k)) < LOD_MIN_PX
+
+    def _render_layer(self, mode, hs):
+        """Рисует коробки hs одной картинкой PIL на видимую часть холста mode."""
+        canvas = getattr(self, f"{mode}_canvas")
+        item = self.layer_item[mode]
+        self.layer_dirty[mode] = []
+        if not hs.size:
+            canvas.itemconfig(item, state="hidden")
+            self.layer_img.pop(mode, None)
+            self.layer_pil.pop(mode, None)
+            return
+        img, x0, y0 = self._layer_image(mode)
+        self._paint_boxes(img, mode, hs, x0, y0)
+        self._show_layer(mode, img, x0, y0)
+
+    def _layer_image(self, mode):
+        """Пустая картинка слоя на видимую часть холста mode и её угол (x0, y0) на холсте."""
+        canvas = getattr(self, f"{mode}_canvas")
+        w, h = self._viewport_px(canvas)
+        x0, y0 = round(canvas.canvasx(0)), round(canvas.canvasy(0))
+        return Image.new("RGBA", (w, h), (0, 0, 0, 0)), x0, y0
+
+    def _show_layer(self, mode, img, x0, y0):
+        """Показывает img слоем холста mode с углом в точке (x0, y0)."""
+        canvas = getattr(self, f"{mode}_canvas")
+        item = self.layer_item[mode]
+        self.layer_pil[mode] = img
+        self.layer_org[mode] = (x0, y0)
+        self.layer_img[mode] = ImageTk.PhotoImage(img)
+        canvas.coords(item, x0, y0)
+        canvas.itemconfig(item, image=self.layer_img[mode], state="normal")
+
+    def _paint_boxes(self, img, mode, hs, x0, y0):
+        """Рисует коробки hs на img, чей левый верхний угол — точка (x0, y0) холста.
+
+        Порядок всегда один (сверху — по z, затем по handle, на других
+        видах — по handle), а углы округляются до целых пикселей холста,
+        поэтому перерисовка куска слоя совпадает с полной отрисовкой.
+        """
+        s = self.store
+        if mode == 'top':                    # как в стопке: выше лежащие — поверх
+            hs = hs[np.lexsort((hs, s.z[hs]))]
+        else:
+            hs = np.sort(hs)
+        self._paint_rects(img, np.column_stack(self._inst_bbox(hs, mode)), s.locked[hs], x0, y0)
+
+    def _paint_rects(self, img, boxes, locked, x0, y0):
+        """Рисует на img прямоугольники boxes (x0, y0, x1, y1 холста) по порядку.
+
+        Углы округляются до целых пикселей; locked — жирная рамка.
+        """
+        boxes = np.rint(boxes).astype(np.int64).reshape(-1, 4)
+        boxes -= (x0, y0, x0, y0)
+        draw = ImageDraw.Draw(img)
+        for (bx0, by0, bx1, by1), lock in zip(boxes.tolist(), np.asarray(locked).tolist()):
+            draw.rectangle((bx0, by0, bx1, by1), fill="#0078D4", outline="black",
+                           width=2 if lock else 1)
+
+    def _repaint_layer(self, mode):
+        """Перерисовывает на слое только грязные прямоугольники (dirty rects).
+
+        Каждый кусок очищается и заново рисуется из коробок слоя, которые
+        его задевают (пространственный запрос LoadPlan.window), так что
+        цена кадра зависит от размера куска, а не от числа коробок.
+        """
+        rects, self.layer_dirty[mode] = self.layer_dirty[mode], []
+        img = self.layer_pil.get(mode)
+        if img is None or len(rects) > LAYER_DIRTY_MAX:
+            self.refresh_view(mode)              # слоя ещё нет или дешевле целиком
+            return
+        s = self.store
+        ids = getattr(s, f"{mode}_id")
+        ax, bx = VIEW_AXES[mode]
+        ox, oy = self.layer_org[mode]
+        w, h = img.size
+        tiles = []
+        for px0, py0, px1, py1 in rects:
+            # запас на рамку толщиной 2 и округление
+            tile = [max(0, int(px0) - ox - 2), max(0, int(py0) - oy - 2),
+                    min(w, int(px1) - ox + 3), min(h, int(py1) - oy + 3)]
+            if tile[0] >= tile[2] or tile[1] >= tile[3]:
+                continue
+            # пересекающиеся куски сливаются: общие коробки рисуются один раз
+            for other in tiles[:]:
+                if (tile[0] < other[2] and other[0] < tile[2] and
+                        tile[1] < other[3] and other[1] < tile[3]):
+                    tiles.remove(other)
+                    tile = [min(tile[0], other[0]), min(tile[1], other[1]),
+                            max(tile[2], other[2]), max(tile[3], other[3])]
+            tiles.append(tile)
+        for ix0, iy0, ix1, iy1 in tiles:
+            a0, a1, b0, b1 = self._px_window_mm(mode, ox + ix0 - 1, ox + ix1 + 1,
+                                               oy + iy0 - 1, oy + iy1 + 1)
+            hs = self.plan.window(ax, a0, a1, bx, b0, b1)
+            hs = hs[ids[hs] == 0]                # живые прямоугольники в слой не входят
+            tile = Image.new("RGBA", (ix1 - ix0, iy1 - iy0), (0, 0, 0, 0))
+            self._paint_boxes(tile, mode, hs, ox + ix0, oy + iy0)
+            img.paste(tile, (ix0, iy0))
+        self.layer_img[mode].paste(img)
 
     # ------------------------------------------------------------------
     # 3D-перетаскивание
     # ------------------------------------------------------------------
     def start_drag(self, evt, mode):
         canvas = getattr(self, f"{mode}_canvas")
-        items = canvas.find_withtag("current")
-        if not items:
+        if self.archive is not None or not canvas.find_withtag("current"):
             self.drag_keys = []
             return
-        clicked_id = items[0]
 
         if self.selected:
             self.drag_keys = list(self.selected)
         else:
-            for c in self.cargos:
-                for idx, inst in enumerate(c.get('instances', [])):
-                    if inst[f"{mode}_id"] == clicked_id:
-                        self.drag_keys = [(c['id'], idx)]
-                        break
-                else:
-                    continue
-                break
-            else:
+            hnd = self.instance_under(canvas, evt.x, evt.y)
+            if hnd is None:
                 self.drag_keys = []
                 return
+            self.drag_keys = [hnd]
+            self.held = {hnd}
+            if any(self.raster.values()):    # из слоя — в живой прямоугольник
+                self.redraw_instance(hnd)
+        # карта высот на время перетаскивания — без самой группы
+        self.drag_plan = self.plan
+        self.plan.detach(self.drag_keys)
         self.drag_start_px = (evt.x, evt.y)
         self.drag_mode = mode
+        self.drag_pointer = None
+        self.drag_stats = {'events': 0, 'frames': 0, 'total_ms': 0.0, 'max_ms': 0.0}
 
     def do_drag(self, evt, mode):
+        """Только запоминает позицию мыши; отрисовка — не чаще раза в кадр."""
         if not hasattr(self, 'drag_keys') or not self.drag_keys:
             return
-
-        dx_px = evt.x - self.drag_start_px[0]
-        dy_px = evt.y - self.drag_start_px[1]
-
-        if mode == 'front':
-            dx_mm = dx_px / (SCALE * 2)
-            dy_mm = dy_px / (SCALE * 2)
-        else:
-            dx_mm = dx_px / SCALE
-            dy_mm = dy_px / SCALE
-
-        group_rects = []
-        exclude_list = [(cid, idx) for cid, idx in self.drag_keys]
-        for cid, idx in self.drag_keys:
-            c = next(c for c in self.cargos if c['id'] == cid)
-            inst = c['instances'][idx]
-            if mode == 'top':
-                gx = max(0, min(self.L - inst['length'], inst['x'] + dx_mm))
-                gy = max(0, min(self.W - inst['width'],  inst['y'] - dy_mm))
-            elif mode == 'side':
-                gx = max(0, min(self.L - inst['length'], inst['x'] + dx_mm))
-                gy = inst['y']
-            else:   # front
-                gx = inst['x']
-                gy = max(0, min(self.W - inst['width'],  inst['y'] + dx_mm))
-            group_rects.append((gx, gy, inst['length'], inst['width']))
-
+        self.drag_pointer = (evt.x, evt.y)
+        self.drag_stats['events'] += 1
+        if self.drag_frame_id is None:
+            self.drag_frame_id = self.root.after(FRAME_MS, self._drag_frame)
+
+    def _drag_frame(self):
+        self.drag_frame_id = None
+        if not self.drag_keys or self.drag_pointer is None:
+            return
+        if self.drag_pointer == self.drag_start_px:
+            return
+        t0 = time.perf_counter()
+        self._apply_drag(*self.drag_pointer, self.drag_mode)
+        frame_ms = (time.perf_counter() - t0) * 1000
+        st = self.drag_stats
+        st['frames'] += 1
+        st['total_ms'] += frame_ms
+        st['max_ms'] = max(st['max_ms'], frame_ms)
+
+    def _apply_drag(self, px, py, mode):
+        dx_px = px - self.drag_start_px[0]
+        dy_px = py - self.drag_start_px[1]
+
+        k = (SCALE * 2 if mode == 'front' else SCALE) * self.zoom[mode]
+        dx_mm = dx_px / k
+        dy_mm = dy_px / k
+
+        moves = []
         common_z = 0
-        for gx, gy, gl, gw in group_rects:
-            common_z = max(common_z,
-                           self.drop_z(gx, gy, gl, gw, exclude_list=exclude_list))
-
-        for cid, idx in self.drag_keys:
-            c = next(c for c in self.cargos if c['id'] == cid)
-            inst = c['instances'][idx]
+        for hnd in self.drag_keys:
+            x, y, z, l, w, h = self.store.box(hnd)
             if mode == 'top':
-                new_x = max(0, min(self.L - inst['length'], inst['x'] + dx_mm))
-                new_y = max(0, min(self.W - inst['width'],  inst['y'] - dy_mm))
+                x, y = x + dx_mm, y - dy_mm
             elif mode == 'side':
-                new_x = max(0, min(self.L - inst['length'], inst['x'] + dx_mm))
-                new_y = inst['y']
+                x = x + dx_mm
             else:   # front
-                new_x = inst['x']
-                new_y = max(0, min(self.W - inst['width'],  inst['y'] + dx_mm))
-            self.move_instance_to(inst, new_x, new_y, common_z)
-        self.drag_start_px = (evt.x, evt.y)
+                y = y + dx_mm
+            new_x, new_y, _ = self.plan.clamp(x, y, z, l, w, h)
+            moves.append((hnd, new_x, new_y))
+            common_z = max(common_z, self.plan.drop_z(new_x, new_y, l, w))
+
+        for hnd, new_x, new_y in moves:
+            self.move_instance_to(hnd, new_x, new_y, common_z)
+        self.drag_start_px = (px, py)
 
     def end_drag(self, evt, mode):
+        if self.drag_frame_id is not None:
+            # последний накопленный сдвиг применяем сразу
+            self.root.after_cancel(self.drag_frame_id)
+            self._drag_frame()
+        if self.drag_keys:
+            if self.drag_stats.get('frames'):
+                # передвинутые вручную коробки закрепляются
+                self.set_locked(self.drag_keys, True)
+            self.report_drag_stats()
+            self.drag_plan.attach(self.drag_keys)
+        self.drag_keys = []
+        held, self.held = self.held, set()
+        for hnd in held:                     # отпущенная коробка возвращается в слой
+            if self.store.alive[hnd]:
+                self.redraw_instance(hnd)
+
+    def cancel_drag(self):
+        """Обрывает перетаскивание, если план перерисовывают под мышью.
+
+        Группа возвращается в карту высот того плана, где её сняли,
+        иначе drop_z так и не увидел бы её.
+        """
+        if self.drag_frame_id is not None:
+            self.root.after_cancel(self.drag_frame_id)
+            self.drag_frame_id = None
+        if self.drag_keys:
+            self.drag_plan.attach(self.drag_keys)
         self.drag_keys = []
+        self.held.clear()
 
-    def move_instance_to(self, inst, x, y, z):
-        inst['x'], inst['y'], inst['z'] = x, y, z
-        l, w, h = inst['length'], inst['width'], inst['height']
-        self.top_canvas.coords(inst['top_id'],
-            10 + x * SCALE, 10 + (self.W - w - y) * SCALE,
-            10 + (x + l) * SCALE, 10 + (self.W - y) * SCALE)
-        self.side_canvas.coords(inst['side_id'],
-            10 + x * SCALE, 10 + (self.H - h - z) * SCALE,
-            10 + (x + l) * SCALE, 10 + (self.H - z) * SCALE)
-        self.front_canvas.coords(inst['front_id'],
-            10 + y * SCALE * 2, 10 + (self.H - h - z) * SCALE * 2,
-            10 + (y + w) * SCALE * 2, 10 + (self.H - z) * SCALE * 2)
-        self.reorder_top_canvas()
-
-    def drop_z(self, x, y, l, w, exclude_list=None):
-        if exclude_list is None:
-            exclude_list = []
-        max_z = 0
-        for c in self.cargos:
-            for idx, inst in enumerate(c.get('instances', [])):
-                if (c['id'], idx) in exclude_list:
-                    continue
-                if (x < inst['x'] + inst['length'] and x + l > inst['x'] and
-                    y < inst['y'] + inst['width'] and y + w > inst['y']):
-                    max_z = max(max_z, inst['z'] + inst['height'])
-        return max_z
+    def report_drag_stats(self):
+        st = self.drag_stats
+        if not st.get('frames'):
+            return
+        dropped = st['events'] - st['frames']
+        self.perf_lbl.config(
+            text=f"Перетаскивание: кадров {st['frames']}, событий слито {dropped}, "
+                 f"кадр {st['total_ms'] / st['frames']:.1f} мс (макс {st['max_ms']:.1f})")
+
+    def move_instance_to(self, hnd, x, y, z, dims=None):
+        z_changed = z != self.store.z[hnd]
+        self.plan.move(hnd, x, y, z, dims)
+        self.redraw_instance(hnd, restack=z_changed)
 
     def clear_canvas(self):
+        if self._edit_blocked():
+            return
         for canv in (self.top_canvas, self.side_canvas, self.front_canvas):
             canv.delete("cargo")
             canv.delete("select_rect")
-        for c in self.cargos:
-            c['placed'] = 0
-            c['instances'] = []
+        self.plan.clear()
+        self.item_owner.clear()
+        self.top_order.clear()
+        self.top_key.clear()
+        self.selected.clear()
+        self.painted.clear()
+        for mode in VIEW_AXES:               # пустой план: слой скрывается
+            self.refresh_view(mode)
+        for c in self.cargos.values():
             self.refresh_tree_row(c)
         self.update_status()
-        self.reorder_top_canvas()
 
     def update_status(self):
-        placed = [c for c in self.cargos if c.get('placed', 0) > 0]
-        total_w = sum(c['weight'] * len(c.get('instances', [])) for c in placed)
-        total_v = sum(inst['length'] * inst['width'] * inst['height']
-                      for c in placed for inst in c.get('instances', [])) / 1e9
-        self.status_lbl.config(text=f"Вес: {total_w} / {MAX_WEIGHT_KG} кг   "
-                                    f"Объём: {total_v:.2f} / {MAX_VOLUME_M3} м³")
+        s = self.store
+        text = (f"Вес: {s.total_weight:.0f} / {self.plan.container.max_weight:.0f} кг   "
+                f"Объём: {s.total_volume / 1e9:.2f} / {MAX_VOLUME_M3} м³")
+        cog = s.center_of_gravity()
+        if cog:
+            text += "\nЦентр тяжести: X {:.0f}  Y {:.0f}  Z {:.0f} мм".format(*cog)
+        if len(self.plans) > 1:
+            text = f"Контейнер {self.plans.index(self.plan) + 1} из {len(self.plans)}\n" + text
+        self.status_lbl.config(text=text)
+
+    def set_locked(self, hnds, locked):
+        """Закрепляет или открепляет коробки текущего плана и меняет их рамку."""
+        self.plan.lock(hnds, locked)
+        s = self.store
+        for hnd in hnds:
+            for canv, ids in ((self.top_canvas, s.top_id), (self.side_canvas, s.side_id),
+                              (self.front_canvas, s.front_id)):
+                if ids[hnd]:
+                    canv.itemconfig(int(ids[hnd]), width=2 if locked else 1)
+        for mode in VIEW_AXES:
+            if self.raster[mode]:
+                ids = getattr(s, f"{mode}_id")
+                for hnd in hnds:
+                    if not ids[hnd]:
+                        self._layer_dirty(mode, hnd)
+
+    def _typed_in_field(self, evt):
+        """True, если клавишу нажали в поле ввода или таблице.
+
+        Горячие клавиши висят на bind_all, а буквы в полях — это ввод текста.
+        """
+        return evt is not None and isinstance(
+            evt.widget, (tk.Entry, tk.Spinbox, ttk.Combobox, ttk.Treeview))
+
+    def toggle_lock_selected(self, evt=None):
+        """Закрепляет выделенные коробки, а если все уже закреплены — открепляет."""
+        if not self.selected or self._typed_in_field(evt) or self._edit_blocked():
+            return
+        hnds = list(self.selected)
+        self.set_locked(hnds, not self.store.locked[hnds].all())
 
     def on_rotate_key(self, evt):
-        if len(self.selected) != 1:
+        if len(self.selected) != 1 or self._typed_in_field(evt):
             return
-        cid, idx = next(iter(self.selected))
-        c = next(c for c in self.cargos if c['id'] == cid)
-        if idx >= len(c.get('instances', [])):
+        hnd = next(iter(self.selected))
+        s = self.store
+        if not s.alive[hnd]:
             return
-        inst = c['instances'][idx]
         items = self.top_canvas.find_withtag("current")
-        if not items or items[0] != inst['top_id']:
+        if not items or items[0] != s.top_id[hnd] or self._edit_blocked():
             return
-        new_l = inst['width']
-        new_w = inst['length']
-        h = inst['height']
-        if (inst['x'] + new_l > self.L) or (inst['y'] + new_w > self.W):
-            messagebox.showerror("Ошибка", "Поворот выходит за границы")
-            return
-        if self.collision_3d(inst['x'], inst['y'], inst['z'], new_l, new_w, h,
-                             exclude_list=[(cid, idx)]):
-            messagebox.showerror("Ошибка", "Поворот приведёт к пересечению")
+        try:
+            self.plan.rotate(hnd)
+        except ValueError as e:
+            messagebox.showerror("Ошибка", str(e))
             return
-        new_z = self.drop_z(inst['x'], inst['y'], new_l, new_w, exclude_list=[(cid, idx)])
-        inst['length'], inst['width'] = new_l, new_w
-        self.move_instance_to(inst, inst['x'], inst['y'], new_z)
+        self.redraw_instance(hnd, restack=True)
 
     # ------------------------------------------------------------------
     #  Добавление партией
     # ------------------------------------------------------------------
     def place_batch(self):
+        if self._edit_blocked():
+            return
         sel = self.tree.selection()
         if not sel:
             messagebox.showerror("Ошибка", "Выберите груз в таблице")
             return
-        cid = int(sel[0])
-        cargo = next(c for c in self.cargos if c['id'] == cid)
-        qty_left = max(0, cargo['qty'] - cargo['placed'])
-        l, w, h = cargo['length'], cargo['width'], cargo['height']
-        gap = 10
-        placed_now = 0
-        x = y = z = 0
-        while placed_now < qty_left:
-            end_x = x + l
-            end_y = y + w
-            end_z = z + h
-            if end_y > self.W:
-                y = 0; x += l + gap; continue
-            if end_x > self.L:
-                x = y = 0; z += h + gap; continue
-            if end_z > self.H:
-                break
-            if self.collision_3d(x, y, z, l, w, h):
-                y += w + gap; continue
-            inst = {
-                'x': x, 'y': y, 'z': z,
-                'length': l, 'width': w, 'height': h,
-                'name': cargo['name'], 'weight': cargo['weight']
-            }
-            tag_suffix = len(cargo.get('instances', []))
-            inst['top_id'] = self.top_canvas.create_rectangle(
-                10 + x * SCALE, 10 + (self.W - w - y) * SCALE,
-                10 + (x + l) * SCALE, 10 + (self.W - y) * SCALE,
-                fill="#0078D4", outline="black",
-                tags=("cargo", f"{cid}_{tag_suffix}"))
-            inst['side_id'] = self.side_canvas.create_rectangle(
-                10 + x * SCALE, 10 + (self.H - h - z) * SCALE,
-                10 + (x + l) * SCALE, 10 + (self.H - z) * SCALE,
-                fill="#0078D4", outline="black",
-                tags=("cargo", f"{cid}_{tag_suffix}"))
-            inst['front_id'] = self.front_canvas.create_rectangle(
-                10 + y * SCALE * 2, 10 + (self.H - h - z) * SCALE * 2,
-                10 + (y + w) * SCALE * 2, 10 + (self.H - z) * SCALE * 2,
-                fill="#0078D4", outline="black",
-                tags=("cargo", f"{cid}_{tag_suffix}"))
-            cargo.setdefault('instances', []).append(inst)
-            cargo['placed'] += 1
-            placed_now += 1
-            y += w + gap
+        cargo = self.cargos[int(sel[0])]
+        self.draw_added(self.plan.place_batch(cargo.id))
         self.refresh_tree_row(cargo)
         self.update_status()
-        self.reorder_top_canvas()
+
+    def auto_load(self):
+        """Укладывает остатки всех строк таблицы вместе, в выбранном порядке."""
+        if self._edit_blocked():
+            return
+        if not any(c.left > 0 for c in self.cargos.values()):
+            messagebox.showerror("Ошибка", "Нет неразмещённых грузов")
+            return
+        t0 = time.perf_counter()
+        added = self.plan.auto_load(AUTO_ORDERS[self.auto_order.get()])
+        pack_ms = (time.perf_counter() - t0) * 1000
+        self.draw_added(added)
+        for c in self.cargos.values():
+            self.refresh_tree_row(c)
+        self.update_status()
+        left = sum(max(0, c.left) for c in self.cargos.values())
+        self.perf_lbl.config(
+            text=f"Автозагрузка: {len(added)} коробок за {pack_ms:.0f} мс, "
+                 f"заполнение {self.plan.fill_ratio() * 100:.1f} %, не поместилось {left}")
+
+    # ------------------------------------------------------------------
+    #  Несколько контейнеров
+    # ------------------------------------------------------------------
+    def load_containers(self):
+        """Раскладывает все остатки по контейнерам, открывая новые по мере нужды.
+
+        Укладка идёт в отдельном процессе, как одна стратегия перебора, и не
+        дольше LOAD_BUDGET_S; окно тем временем не замирает.
+        """
+        if self._edit_blocked():
+            return
+        if self.opt is not None or self.search is not None:
+            messagebox.showerror("Ошибка", "Дождитесь окончания поиска")
+            return
+        if not any(c.left > 0 for c in self.cargos.values()):
+            messagebox.showerror("Ошибка", "Нет неразмещённых грузов")
+            return
+        pool = ProcessPoolExecutor(max_workers=1)
+        self.search = {
+            'pool': pool,
+            'futures': [submit_strategy(pool, self.plans, AUTO_ORDERS[self.auto_order.get()],
+                                        'floor', LOAD_BUDGET_S)],
+            't0': time.perf_counter(),
+            'deadline': time.perf_counter() + LOAD_BUDGET_S + 1,
+            'signature': self._plan_signature(),
+        }
+        self.perf_lbl.config(text="Загрузка контейнеров…")
+        self.root.after(SEARCH_POLL_MS, self._poll_load)
+
+    def _poll_load(self):
+        st = self.search
+        future = st['futures'][0]
+        if not future.done() and time.perf_counter() < st['deadline']:
+            self.perf_lbl.config(
+                text=f"Загрузка контейнеров: {time.perf_counter() - st['t0']:.1f} с")
+            self.root.after(SEARCH_POLL_MS, self._poll_load)
+            return
+        st['pool'].shutdown(wait=False, cancel_futures=True)
+        self.search = None
+        if not future.done() or future.cancelled() or future.exception() is not None:
+            messagebox.showerror("Ошибка", "Загрузка не успела за отведённое время")
+            return
+        if self._plan_signature() != st['signature']:
+            messagebox.showerror("Ошибка", "План изменился во время загрузки, результат отброшен")
+            return
+        r = future.result()
+        added = self._apply_strategy(r)
+        fills = " / ".join(f"{p.fill_ratio() * 100:.0f}" for p in self.plans)
+        left = sum(max(0, c.left) for c in self.cargos.values())
+        self.perf_lbl.config(
+            text=f"Контейнеров: {len(self.plans)}, уложено {sum(map(len, added.values()))} "
+                 f"за {r.elapsed * 1000:.0f} мс" + (" (бюджет)" if r.timed_out else "") +
+                 f"\nзаполнение {fills} %, не поместилось {left}")
+
+    def replan(self):
+        """Тёплый старт: раскладывает остатки вокруг уже стоящих коробок.
+
+        Закреплённые коробки остаются на месте, незакреплённые — тоже, если
+        влезают; заново укладываются только те, что выходят за контейнер,
+        пересекаются с другими или не проходят по весу.
+        """
+        if self._edit_blocked():
+            return
+        if self.opt is not None or self.search is not None:
+            messagebox.showerror("Ошибка", "Дождитесь окончания поиска")
+            return
+        t0 = time.perf_counter()
+        added = replan(self.plans, AUTO_ORDERS[self.auto_order.get()])
+        pack_ms = (time.perf_counter() - t0) * 1000
+        if self.plan not in self.plans:
+            self.plan = self.plans[0]
+        self.container_box.config(values=[f"Контейнер {i + 1}" for i in range(len(self.plans))])
+        self.container_box.current(self.plans.index(self.plan))
+        self.redraw_plan()
+        for c in self.cargos.values():
+            self.refresh_tree_row(c)
+        fills = " / ".join(f"{p.fill_ratio() * 100:.0f}" for p in self.plans)
+        left = sum(max(0, c.left) for c in self.cargos.values())
+        self.perf_lbl.config(
+            text=f"Дозаполнение: {sum(map(len, added.values()))} коробок за {pack_ms:.0f} мс\n"
+                 f"заполнение {fills} %, не поместилось {left}")
+
+    def _plan_signature(self):
+        """Отпечаток планов: меняется от любой правки коробок или грузов.
+
+        Закрепление тоже в счёт: отжиг перекладывает только незакреплённые.
+        """
+        plans = []
+        for p in self.plans:
+            s = p.store
+            hs = s.handles()
+            plans.append((len(s), tuple(s.moment), hash(hs[s.locked[hs]].tobytes())))
+        return (tuple(plans),
+                tuple((c.id, c.qty, c.placed, c.dims, c.weight, c.upright)
+                      for c in self.cargos.values()))
+
+    def search_strategies(self):
+        """Запускает перебор стратегий в процессах; окно опрашивает их по таймеру."""
+        if self._edit_blocked():
+            return
+        if self.search is not None:
+            messagebox.showerror("Ошибка", "Перебор уже идёт")
+            return
+        if not any(c.left > 0 for c in self.cargos.values()):
+            messagebox.showerror("Ошибка", "Нет неразмещённых грузов")
+            return
+        try:
+            n = max(1, min(len(STRATEGIES), int(self.strat_n.get())))
+            budget = float(self.strat_budget.get())
+            if budget <= 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Ошибка", "Проверьте ввод")
+            return
+        pool = ProcessPoolExecutor(max_workers=min(n, os.cpu_count() or 1))
+        self.search = {
+            'pool': pool,
+            'futures': submit_all(pool, self.plans, n, budget),
+            't0': time.perf_counter(),
+            # процессы сами останавливаются по бюджету; секунда — на возврат результата
+            'deadline': time.perf_counter() + budget + 1,
+            'signature': self._plan_signature(),
+        }
+        self.perf_lbl.config(text=f"Перебор: 0 / {n} стратегий")
+        self.root.after(SEARCH_POLL_MS, self._poll_search)
+
+    def _poll_search(self):
+        st = self.search
+        futures = st['futures']
+        done = [f for f in futures if f.done()]
+        if len(done) < len(futures) and time.perf_counter() < st['deadline']:
+            self.perf_lbl.config(
+                text=f"Перебор: {len(done)} / {len(futures)} стратегий, "
+                     f"{time.perf_counter() - st['t0']:.1f} с")
+            self.root.after(SEARCH_POLL_MS, self._poll_search)
+            return
+        st['pool'].shutdown(wait=False, cancel_futures=True)
+        self.search = None
+        results = [f.result() for f in done if not f.cancelled() and f.exception() is None]
+        if not results:
+            messagebox.showerror("Ошибка", "Ни одна стратегия не успела за отведённое время")
+            return
+        results.sort(key=lambda r: r.rank())
+        lines = [f"{r.order}/{r.score}: конт. {r.containers}, "
+                 f"заполнение {' / '.join(f'{f * 100:.0f}' for f in r.fills)} %, "
+                 f"осталось {r.left}, {r.elapsed:.2f} с, pid {r.pid}"
+                 + (" (бюджет)" if r.timed_out else "")
+                 for r in results]
+        lost = len(futures) - len(results)
+        if lost:
+            lines.append(f"не успели или упали: {lost}")
+        self.perf_lbl.config(text="Перебор, лучшая первой:\n" + "\n".join(lines))
+        if self._plan_signature() != st['signature']:
+            messagebox.showerror("Ошибка", "План изменился во время перебора, результат отброшен")
+            return
+        self._apply_strategy(results[0])
+
+    def _apply_strategy(self, result):
+        """Ставит коробки результата стратегии в планы и рисует новые коробки.
+
+        Возвращает {номер плана: handle новых коробок}.
+        """
+        added = apply_result(self.plans, result)
+        self.container_box.config(values=[f"Контейнер {i + 1}" for i in range(len(self.plans))])
+        self.draw_added(added.get(self.plans.index(self.plan), ()))
+        for c in self.cargos.values():
+            self.refresh_tree_row(c)
+        self.update_status()
+        return added
+
+    # ------------------------------------------------------------------
+    #  Оптимизация отжигом
+    # ------------------------------------------------------------------
+    def optimize(self):
+        """Запускает отжиг в отдельном процессе; улучшения сразу показываются.
+
+        Закреплённые коробки остаются на местах, незакреплённые отжиг
+        перекладывает, начиная с их текущей укладки.
+        """
+        if self._edit_blocked():
+            return
+        if self.opt is not None or self.search is not None:
+            messagebox.showerror("Ошибка", "Поиск уже идёт")
+            return
+        if not any(c.left > 0 for c in self.cargos.values()) and \
+                all(p.store.locked[p.store.handles()].all() for p in self.plans):
+            messagebox.showerror("Ошибка", "Нет незакреплённых и неразмещённых грузов")
+            return
+        try:
+            budget = float(self.opt_budget.get())
+            if budget <= 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Ошибка", "Проверьте ввод")
+            return
+        proc, msgs, stop = start_anneal(self.plans, budget)
+        self.opt = {
+            'proc': proc, 'queue': msgs, 'stop': stop,
+            # планы дальше — без закреплённых коробок, отжиг открывает их заново
+            'base': max((i + 1 for i, p in enumerate(self.plans)
+                         if p.store.locked[p.store.handles()].any()), default=1),
+            'signature': self._plan_signature(),
+            'rate': 0.0, 'plans': 0, 'best': None,
+        }
+        self.perf_lbl.config(text="Оптимизация: запуск…")
+        self.root.after(SEARCH_POLL_MS, self._poll_optimize)
+
+    def stop_optimize(self):
+        """Просит процесс отжига остановиться; лучший план уже на холсте."""
+        if self.opt is not None:
+            self.opt['stop'].set()
+
+    def _poll_optimize(self):
+        st = self.opt
+        best = None
+        done = False
+        while True:
+            try:
+                msg = st['queue'].get_nowait()
+            except queue.Empty:
+                break
+            if msg[0] == 'best':
+                best = msg[1]
+            else:
+                st['plans'], elapsed = msg[1], msg[2]
+                st['rate'] = msg[1] / elapsed if elapsed > 0 else 0.0
+                done = msg[0] == 'done'
+        if best is not None:
+            # из нескольких улучшений за период показываем только последнее
+            if self._plan_signature() != st['signature']:
+                st['stop'].set()
+                st['proc'].join(1)
+                self.opt = None
+                messagebox.showerror("Ошибка", "План изменился во время оптимизации, она остановлена")
+                return
+            self._apply_optimized(best)
+        r = st['best']
+        text = f"Оптимизация: {st['plans']} планов, {st['rate']:.1f} планов/с"
+        if r is not None:
+            text += (f"\nлучший: конт. {r.containers}, "
+                     f"заполнение {' / '.join(f'{f * 100:.0f}' for f in r.fills)} %, "
+                     f"осталось {r.left}")
+        if done or not st['proc'].is_alive() and st['queue'].empty():
+            self.opt = None
+            self.perf_lbl.config(text=text + "\nоптимизация завершена")
+            return
+        self.perf_lbl.config(text=text)
+        self.root.after(SEARCH_POLL_MS, self._poll_optimize)
+
+    def _apply_optimized(self, result):
+        """Заменяет все незакреплённые коробки коробками result."""
+        st = self.opt
+        for plan in self.plans:
+            plan.release()
+        del self.plans[st['base']:]
+        apply_result(self.plans, result)
+        st['best'] = result
+        if self.plan not in self.plans:
+            self.plan = self.plans[0]
+        self.container_box.config(values=[f"Контейнер {i + 1}" for i in range(len(self.plans))])
+        self.container_box.current(self.plans.index(self.plan))
+        self.redraw_plan()
+        for c in self.cargos.values():
+            self.refresh_tree_row(c)
+        self.update_status()
+        st['signature'] = self._plan_signature()
+
+    def show_container(self, index):
+        """Показывает на холстах план контейнера index."""
+        if self.archive is not None:
+            self.draw_archive(index)
+            return
+        if self.plans[index] is self.plan:
+            return
+        self.plan = self.plans[index]
+        self.redraw_plan()
+
+    def redraw_plan(self):
+        """Заново рисует все коробки показанного плана."""
+        # перетаскивание, выделение и удержание могли относиться к другому плану
+        self.cancel_drag()
+        self.painted.clear()
+        self.clear_selection()
+        for canv in (self.top_canvas, self.side_canvas, self.front_canvas):
+            canv.delete("cargo")
+        self.item_owner.clear()
+        self.top_order.clear()
+        self.top_key.clear()
+        self.draw_added(self.store.handles())
+        self.update_status()
+
+# ========================== КЭШ ФОНОВ ===================================
+class TextureCache:
+    """Фоны видов, уже приведённые к нужному размеру.
+
+    Ключ — (файл, время его изменения, размер), так что правка PNG или
+    новый масштаб дают новый ключ. В памяти держатся готовые PhotoImage
+    (LRU, TEXTURE_MEM_ITEMS штук), на диске — уменьшенные PNG (LRU по
+    времени последнего обращения, не больше TEXTURE_DISK_BYTES), чтобы
+    после перезапуска не пересчитывать LANCZOS. Ошибки записи на диск
+    не мешают работе: кэш остаётся только в памяти.
+    """
+    def __init__(self, cache_dir, mem_items=TEXTURE_MEM_ITEMS, disk_bytes=TEXTURE_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.mem_items = mem_items
+        self.disk_bytes = disk_bytes
+        self.mem = OrderedDict()             # ключ -> PhotoImage
+        self.stats = {'mem': 0, 'disk': 0, 'resized': 0}
+
+    def get(self, path, size):
+        """PhotoImage картинки path размера size = (ширина, высота)."""
+        path = os.path.abspath(path)
+        key = (path, os.path.getmtime(path), tuple(size))
+        photo = self.mem.get(key)
+        if photo is not None:
+            self.mem.move_to_end(key)
+            self.stats['mem'] += 1
+            return photo
+        photo = ImageTk.PhotoImage(self._load(key))
+        self.mem[key] = photo
+        while len(self.mem) > self.mem_items:
+            self.mem.popitem(last=False)
+        return photo
+
+    def _load(self, key):
+        path, _, size = key
+        name = hashlib.sha1(repr(key).encode("utf-8")).hexdigest() + ".png"
+        disk = os.path.join(self.cache_dir, name)
+        try:
+            img = Image.open(disk)
+            img.load()
+            os.utime(disk)                   # отметка для LRU
+            self.stats['disk'] += 1
+            return img
+        except OSError:
+            pass
+        img = Image.open(path).convert("RGBA").resize(size, Image.LANCZOS)
+        self.stats['resized'] += 1
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = disk + ".tmp"
+            img.save(tmp, format="PNG")
+            os.replace(tmp, disk)
+            self._trim_disk()
+        except OSError:
+            pass
+        return img
+
+    def _trim_disk(self):
+        """Удаляет давно не нужные файлы, пока кэш больше disk_bytes."""
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".png"):
+                st = entry.stat()
+                files.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_bytes:
+                break
+            os.remove(path)
+            total -= size
 
 # =========================== TOOLTIP ====================================
 class Tooltip:
@@ -858,21 +2133,10 @@ class Tooltip:
     def on_motion(self, event):
         if not self.canvas.winfo_exists():
             return
-        items = event.widget.find_withtag("current")
-        if not items:
-            self.hide(); return
-        clicked_id = items[0]
-        cargo = None
-        for c in self.app.cargos:
-            for ins in c.get('instances', []):
-                if clicked_id in (ins.get('top_id'), ins.get('side_id'), ins.get('front_id')):
-                    cargo = c
-                    inst = ins
-                    break
-            if cargo:
-                break
-        if cargo:
-            text = f"{cargo['name']}  {inst['weight']} кг"
+        hnd = self.app.instance_under(self.canvas, event.x, event.y)
+        if hnd is not None:
+            store = self.app.store
+            text = f"{store.name(hnd)}  {store.weight[hnd]:g} кг"
             self.show(text, event.x_root, event.y_root)
         else:
             self.hide()